@@ -0,0 +1,26 @@
+import subprocess
+import sys
+
+import pytest
+
+from import_time import ROOT
+
+HEAVY_MODULES = ['boto3', 'botocore', 'requests', 'urllib3', 'validators', 'elasticsearch', 'slack', 'multiprocessing']
+
+
+@pytest.mark.benchmark(group='import')
+@pytest.mark.parametrize('statement', [
+	'from easy import MetadataUtils, ClearMeta, FingerprintEngine',
+	'from easy.Utils import Utils, MetadataUtils',
+	'from easy.MCMHelper import MCMHelper',
+], ids=['facade', 'utils', 'mcm_helper'])
+def bench_import_pure_utilities(benchmark, statement):
+	check = f'import sys; {statement}; print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))'
+
+	def run():
+		return subprocess.run(
+			[sys.executable, '-c', check],
+			cwd=ROOT, stdout=subprocess.PIPE, universal_newlines=True, check=True
+		).stdout.strip()
+
+	assert benchmark(run) == ''
@@ -0,0 +1,26 @@
+import pytest
+
+from easy.MCMHelper import MCMHelper
+
+
+@pytest.mark.benchmark(group='merge_mcm_mythem')
+def bench_merge_mcm_mythem(benchmark, peak_memory, catalog, mcm_documents, mythem_documents):
+	keys = catalog.keys()
+	helper = MCMHelper(
+		s3=None,
+		data_conf={},
+		content_conf={
+			'blacklist_metas': keys[:2],
+			'blacklist_metavalues': ['value0', 'value1']
+		}
+	)
+	common_metas = keys[::3]
+	pairs = list(zip(mcm_documents, mythem_documents))
+
+	def run():
+		# merge_mcm_mythem updates the MCM dict: merge a copy of it
+		return [helper.merge_mcm_mythem(mythem, dict(mcm), common_metas) for mcm, mythem in pairs]
+
+	peak_memory(run)
+	result = benchmark(run)
+	assert all('fingerprint' in doc for doc in result)
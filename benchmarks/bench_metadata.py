@@ -0,0 +1,44 @@
+import pytest
+
+from easy.Utils import MetadataUtils
+
+
+@pytest.mark.benchmark(group='get_clear_meta_dict')
+def bench_get_clear_meta_dict(benchmark, peak_memory, catalog, mcm_documents):
+	blacklist = catalog.keys()[:2]
+	array_list = catalog.keys()[2:10]
+
+	def run():
+		return [
+			MetadataUtils.get_clear_meta_dict(doc['clear_metas'], blacklist, '=', array_list)
+			for doc in mcm_documents
+		]
+
+	peak_memory(run)
+	benchmark(run)
+
+
+@pytest.mark.benchmark(group='merge_lst')
+def bench_merge_lst(benchmark, peak_memory, catalog, mcm_documents, mythem_documents):
+	common_metas = catalog.keys()[::3]
+	pairs = list(zip(mcm_documents, mythem_documents))
+
+	def run():
+		return [
+			MetadataUtils.merge_lst(common_metas, mcm['clear_metas'], mythem['clear_metas'])
+			for mcm, mythem in pairs
+		]
+
+	peak_memory(run)
+	benchmark(run)
+
+
+@pytest.mark.benchmark(group='hashing_meta')
+@pytest.mark.parametrize('version', ['md5', 'blake2b'])
+def bench_hashing_meta(benchmark, catalog, mcm_documents, version):
+	bl = catalog.keys()[:2]
+
+	def run():
+		return [MetadataUtils.hashing_meta(doc['clear_metas'], bl=bl, version=version) for doc in mcm_documents]
+
+	benchmark(run)
@@ -0,0 +1,98 @@
+import os
+
+import boto3
+import pytest
+
+try:
+	from moto import mock_aws
+except ImportError:
+	from moto import mock_s3 as mock_aws
+
+from easy.Utils import S3Utils, Utils
+
+BUCKET = 'bench-bucket'
+SMALL_FILES = 200
+
+
+@pytest.fixture(scope='module')
+def s3(mcm_documents):
+	os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+	os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+	with mock_aws():
+		s3 = boto3.resource('s3', region_name='eu-west-1')
+		s3.meta.client.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'})
+		for i, doc in enumerate(mcm_documents[:SMALL_FILES]):
+			S3Utils.write_json_if_toupdate(s3, doc, BUCKET, f'docs/{i}.json', write_anyway=True)
+		S3Utils.write_json_lines(mcm_documents, f's3://{BUCKET}/catalog.jsonl', s3)
+		S3Utils.write_json_lines(mcm_documents, f's3://{BUCKET}/catalog.jsonl.gz', s3)
+		yield s3
+
+
+@pytest.fixture(scope='module')
+def small_files(mcm_documents):
+	return min(SMALL_FILES, len(mcm_documents))
+
+
+@pytest.mark.benchmark(group='s3_read')
+def bench_read_s3_file(benchmark, s3, small_files):
+	def run():
+		return [S3Utils.read_s3_file(s3, BUCKET, f'docs/{i}.json') for i in range(small_files)]
+
+	benchmark(run)
+
+
+@pytest.mark.benchmark(group='s3_read')
+def bench_load_json(benchmark, s3, small_files):
+	def run():
+		return [Utils.load_json(f's3://{BUCKET}/docs/{i}.json', s3) for i in range(small_files)]
+
+	benchmark(run)
+
+
+@pytest.mark.benchmark(group='s3_read')
+def bench_read_s3_file_not_modified(benchmark, s3, small_files):
+	etags = [S3Utils.read_s3_file_if_changed(s3, BUCKET, f'docs/{i}.json')[1] for i in range(small_files)]
+
+	def run():
+		return [
+			S3Utils.read_s3_file_if_changed(s3, BUCKET, f'docs/{i}.json', etag)
+			for i, etag in enumerate(etags)
+		]
+
+	result = benchmark(run)
+	assert all(content is None for content, _ in result)
+
+
+@pytest.mark.benchmark(group='s3_read')
+def bench_json_already_exists(benchmark, s3, small_files, mcm_documents):
+	def run():
+		return [
+			S3Utils.json_already_exists(s3, doc, BUCKET, f'docs/{i}.json')
+			for i, doc in enumerate(mcm_documents[:small_files])
+		]
+
+	result = benchmark(run)
+	assert all(result)
+
+
+@pytest.mark.benchmark(group='s3_json_lines')
+@pytest.mark.parametrize('key', ['catalog.jsonl', 'catalog.jsonl.gz'])
+def bench_iter_json_lines(benchmark, peak_memory, s3, mcm_documents, key):
+	def run():
+		return sum(1 for _ in S3Utils.iter_json_lines(f's3://{BUCKET}/{key}', s3))
+
+	peak_memory(run)
+	assert benchmark(run) == len(mcm_documents)
+
+
+@pytest.mark.benchmark(group='s3_sync')
+def bench_sync_json_documents_unchanged(benchmark, s3, small_files, mcm_documents):
+	documents = {f'{i}.json': doc for i, doc in enumerate(mcm_documents[:small_files])}
+	S3Utils.sync_json_documents(s3, BUCKET, 'sync/', documents)
+
+	def run():
+		return S3Utils.sync_json_documents(s3, BUCKET, 'sync/', documents)
+
+	report = benchmark(run)
+	assert len(report['unchanged']) == len(documents)
+
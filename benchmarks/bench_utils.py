@@ -0,0 +1,39 @@
+import pytest
+
+from easy.Utils import Utils
+
+
+@pytest.mark.benchmark(group='normalize_json')
+def bench_normalize_json(benchmark, peak_memory, mcm_documents):
+	key_blacklist = ['id', 'title']
+
+	def run():
+		return [Utils.normalize_json(doc, key_blacklist) for doc in mcm_documents]
+
+	peak_memory(run)
+	result = benchmark(run)
+	assert len(result) == len(mcm_documents)
+
+
+@pytest.mark.benchmark(group='isin')
+@pytest.mark.parametrize('patterns', [
+	['meta1', 'meta2', 'meta3'],
+	['meta1', 'meta2', 'meta.*5', '^value[0-9]+$', 'meta1[0-9]'],
+], ids=['literal', 'regex'])
+def bench_isin(benchmark, mcm_documents, patterns):
+	values = [meta for doc in mcm_documents for meta in doc['clear_metas']]
+
+	def run():
+		return sum(1 for value in values if Utils.isin(value, patterns))
+
+	benchmark(run)
+
+
+@pytest.mark.benchmark(group='ordered_obj')
+def bench_ordered_obj(benchmark, peak_memory, mcm_documents):
+	def run():
+		return [Utils.ordered_obj(doc) for doc in mcm_documents]
+
+	peak_memory(run)
+	result = benchmark(run)
+	assert len(result) == len(mcm_documents)
@@ -0,0 +1,103 @@
+import random
+import tracemalloc
+
+import pytest
+
+
+def pytest_addoption(parser):
+	group = parser.getgroup('catalog', 'synthetic catalog size')
+	group.addoption('--docs', type=int, default=1000, help='number of documents of the catalog')
+	group.addoption('--clear-meta-len', type=int, default=50, help='clear_metas items of each document')
+	group.addoption('--key-cardinality', type=int, default=30, help='distinct clear_metas keys')
+	group.addoption('--seed', type=int, default=42, help='seed of the catalog generator')
+
+
+class CatalogGenerator:
+	"""
+	Deterministic generator of synthetic MCM/Mythematics documents
+		>>> catalog = CatalogGenerator(docs=1000, clear_meta_len=50, key_cardinality=30)
+		>>> catalog.documents()[0]['clear_metas'][:2]
+		>>> ['meta3=value17', 'meta12=2019']
+	"""
+	VALUES_PER_KEY = 50
+
+	def __init__(self, docs=1000, clear_meta_len=50, key_cardinality=30, seed=42):
+		self.docs = docs
+		self.clear_meta_len = clear_meta_len
+		self.key_cardinality = key_cardinality
+		self.seed = seed
+
+	def keys(self):
+		return [f'meta{i}' for i in range(self.key_cardinality)]
+
+	def clear_metas(self, rnd):
+		keys = self.keys()
+		clear_metas = []
+		for _ in range(self.clear_meta_len):
+			key = rnd.choice(keys)
+			kind = rnd.random()
+			if kind < 0.1:
+				value = str(rnd.randint(1950, 2023))
+			elif kind < 0.15:
+				value = rnd.choice(['True', 'false', 'SI', 'no'])
+			else:
+				value = f'value{rnd.randrange(self.VALUES_PER_KEY)}'
+			clear_metas.append(f'{key}={value}')
+		return clear_metas
+
+	def document(self, rnd, i):
+		return {
+			'id': f'F{i:09d}',
+			'title': f'Title {i}',
+			'idserie': f'S{i % 97:06d}',
+			'numeroepisodi': str(rnd.randint(1, 30)),
+			'numerostagioni': str(rnd.randint(1, 10)),
+			'published': rnd.choice(['True', 'False']),
+			'updated_at': f'20{rnd.randint(10, 23)}-0{rnd.randint(1, 9)}-1{rnd.randint(0, 9)}T10:00:00Z',
+			'url': f'https://example.com/video/{i}',
+			'tags': [f'tag{rnd.randrange(20)}' for _ in range(5)],
+			'extra': {'rating': str(rnd.randint(0, 10)), 'hd': rnd.choice(['true', 'false'])},
+			'clear_metas': self.clear_metas(rnd)
+		}
+
+	def documents(self, seed_offset=0):
+		rnd = random.Random(self.seed + seed_offset)
+		return [self.document(rnd, i) for i in range(self.docs)]
+
+
+@pytest.fixture(scope='session')
+def catalog(request):
+	return CatalogGenerator(
+		docs=request.config.getoption('docs'),
+		clear_meta_len=request.config.getoption('clear_meta_len'),
+		key_cardinality=request.config.getoption('key_cardinality'),
+		seed=request.config.getoption('seed')
+	)
+
+
+@pytest.fixture(scope='session')
+def mcm_documents(catalog):
+	return catalog.documents()
+
+
+@pytest.fixture(scope='session')
+def mythem_documents(catalog):
+	return catalog.documents(seed_offset=1)
+
+
+@pytest.fixture
+def peak_memory(benchmark):
+	"""
+	run func once under tracemalloc and store its peak memory (bytes) in the benchmark
+	extra_info, so that it is saved and compared with the timings
+	"""
+	def measure(func, *args, **kwargs):
+		tracemalloc.start()
+		try:
+			func(*args, **kwargs)
+			_, peak = tracemalloc.get_traced_memory()
+		finally:
+			tracemalloc.stop()
+		benchmark.extra_info['peak_memory_bytes'] = peak
+		return peak
+	return measure
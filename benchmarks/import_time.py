@@ -0,0 +1,63 @@
+"""
+Import time of the easy modules, each measured in a fresh interpreter with
+python -X importtime (run it twice: the first run also compiles the .pyc files).
+Modules already imported by the interpreter startup are not counted.
+	$ python benchmarks/import_time.py
+	$ python benchmarks/import_time.py 'from easy import MetadataUtils' --top 10
+"""
+import argparse
+import os
+import pkgutil
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(statement):
+	"""
+	:param statement: python statement
+	:return: list of (module, depth, self microseconds, cumulative microseconds), in import order
+	"""
+	env = dict(os.environ, PYTHONPATH=ROOT)
+	result = subprocess.run(
+		[sys.executable, '-X', 'importtime', '-c', statement],
+		env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True
+	)
+	times = []
+	for line in result.stderr.splitlines():
+		if not line.startswith('import time:') or 'self [us]' in line:
+			continue
+		self_us, cumulative_us, module = line[len('import time:'):].split('|')
+		# the module name is indented by 2 spaces for each nesting level
+		name = module.lstrip()
+		times.append((name, (len(module) - len(name) - 1) // 2, int(self_us), int(cumulative_us)))
+	return times
+
+
+def report(statement, top, startup_modules):
+	times = [t for t in import_times(statement) if t[0] not in startup_modules]
+	total_us = sum(cumulative for _, depth, _, cumulative in times if depth == 0)
+	print(f'{statement}: {total_us / 1000:.1f} ms')
+	for module, _, _, cumulative in sorted(times, key=lambda t: t[3], reverse=True)[:top]:
+		print(f'\t{cumulative / 1000:8.1f} ms  {module}')
+
+
+def main():
+	parser = argparse.ArgumentParser(description='import time of the easy modules')
+	parser.add_argument('statements', nargs='*', help='import statements (default: every easy module)')
+	parser.add_argument('--top', type=int, default=5, help='heaviest imports listed for each statement')
+	args = parser.parse_args()
+
+	statements = args.statements or ['import easy'] + [
+		f'import easy.{module.name}'
+		for module in pkgutil.iter_modules([os.path.join(ROOT, 'easy')])
+	]
+	# modules imported by the interpreter startup (site, encodings, ...) are not counted
+	startup_modules = {module for module, _, _, _ in import_times('pass')}
+	for statement in statements:
+		report(statement, args.top, startup_modules)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,180 @@
+import asyncio
+import json
+
+from aiobotocore.config import AioConfig
+from aiobotocore.session import AioSession
+from botocore.exceptions import ClientError
+
+from easy.Utils import S3Utils, Utils
+
+
+class AsyncS3Utils:
+	"""
+	asyncio counterpart of S3Utils (same semantics, digest metadata included).
+	All the coroutines of an instance share a single aiobotocore client (and so a
+	single connection pool of max_pool_connections connections), while
+	max_concurrency bounds the S3 requests in flight.
+		>>> async with AsyncS3Utils(max_pool_connections=200) as s3_utils:
+		>>> 	js_strings = await asyncio.gather(*[
+		>>> 		s3_utils.read_s3_file(bucket, key) for key in keys
+		>>> 	])
+	"""
+	def __init__(
+			self,
+			region_name='eu-west-1',
+			profile_name=None,
+			max_pool_connections=100,
+			max_concurrency=None,
+			**client_kwargs
+	):
+		"""
+		:param region_name: aws region
+		:param profile_name: aws profile (optional)
+		:param max_pool_connections: size of the connection pool
+		:param max_concurrency: max number of requests in flight (default max_pool_connections)
+		:param client_kwargs: other arguments for the aiobotocore client (e.g. endpoint_url)
+		"""
+		self.region_name = region_name
+		self.max_concurrency = max_pool_connections if max_concurrency is None else max_concurrency
+
+		self._session = AioSession(profile=profile_name)
+		self._config = AioConfig(max_pool_connections=max_pool_connections)
+		self._client_kwargs = client_kwargs
+		self._client_cm = None
+		self._semaphore = None
+		self._open_lock = None
+		self.client = None
+
+	async def open(self):
+		"""
+		create the client (and the semaphore) once: concurrent first calls wait for
+		the client created by the first one
+		"""
+		if self.client is not None:
+			return self
+		if self._open_lock is None:
+			# created lazily, in the event loop of the first call
+			self._open_lock = asyncio.Lock()
+		async with self._open_lock:
+			if self.client is None:
+				client_cm = self._session.create_client(
+					's3',
+					region_name=self.region_name,
+					config=self._config,
+					**self._client_kwargs
+				)
+				self._semaphore = asyncio.Semaphore(self.max_concurrency)
+				self.client = await client_cm.__aenter__()
+				self._client_cm = client_cm
+		return self
+
+	async def close(self):
+		if self._open_lock is None:
+			return
+		async with self._open_lock:
+			if self.client is not None:
+				client_cm = self._client_cm
+				self._client_cm = None
+				self.client = None
+				self._semaphore = None
+				await client_cm.__aexit__(None, None, None)
+
+	async def __aenter__(self):
+		return await self.open()
+
+	async def __aexit__(self, exc_type, exc, tb):
+		await self.close()
+
+	async def write_s3_file(self, bucket, key, str_file, metadata=None, compression=None, compression_level=None):
+		"""
+		:param bucket:
+		:param key:
+		:param str_file: str or bytes
+		:param metadata: user metadata of the object (optional)
+		:param compression: None, 'gzip' or 'zstd' (see S3Utils.write_s3_file)
+		:param compression_level: compression level (default that of the algorithm)
+		:return:
+		"""
+		await self.open()
+		put_args = dict(Bucket=bucket, Key=key, Body=str_file)
+		if metadata:
+			put_args['Metadata'] = metadata
+		if compression is not None:
+			if isinstance(str_file, str):
+				str_file = str_file.encode('utf-8')
+			put_args['Body'] = S3Utils.compress(str_file, compression, compression_level)
+			put_args['ContentEncoding'] = compression
+		async with self._semaphore:
+			return await self.client.put_object(**put_args)
+
+	async def head_s3_file(self, bucket, key):
+		"""
+		return the HEAD response of an s3 object without downloading it
+		"""
+		await self.open()
+		async with self._semaphore:
+			try:
+				return await self.client.head_object(Bucket=bucket, Key=key)
+			except ClientError as e:
+				if e.response['Error']['Code'].lower() in ['404', 'notfound', 'nosuchbucket', 'nosuchkey']:
+					raise FileNotFoundError(f'File {bucket}/{key} not found: {e}')
+				else:
+					raise e
+
+	async def read_s3_file(self, bucket, key, encoding='utf-8'):
+		"""
+		return the content of an s3 file as a string (decompressed according to its Content-Encoding)
+		:param bucket: s3 bucket
+		:param key: s3 key
+		:param encoding: how to decode byte read
+		:return: the decoded content of the file
+		"""
+		await self.open()
+		async with self._semaphore:
+			try:
+				s3_obj = await self.client.get_object(Bucket=bucket, Key=key)
+				async with s3_obj['Body'] as stream:
+					js_bytes = await stream.read()
+				content_encoding = s3_obj.get('ContentEncoding')
+			except ClientError as e:
+				if e.response['Error']['Code'].lower() in ['nosuchbucket', 'nosuchkey']:
+					raise FileNotFoundError(f'File {bucket}/{key} not found: {e}')
+				else:
+					raise e
+		return S3Utils.decode_body(js_bytes, content_encoding, encoding)
+
+	async def json_already_exists(self, json_result, s3_bucket, s3_key, drop=None, digest=None):
+		try:
+			head = await self.head_s3_file(s3_bucket, s3_key)
+		except FileNotFoundError:
+			return False
+		except ClientError as e:
+			if e.response['Error']['Code'].lower() in S3Utils.FORBIDDEN_CODES:
+				return False
+			raise e
+
+		digest = Utils.json_digest(json_result, drop=drop) if digest is None else digest
+		last_digest = S3Utils.stored_digest(head, drop)
+		if last_digest is None:
+			try:
+				last_js = json.loads(await self.read_s3_file(s3_bucket, s3_key))
+			except FileNotFoundError:
+				return False
+			last_digest = Utils.canonical_digest(last_js, drop=drop)
+
+		return digest == last_digest
+
+	async def write_json_if_toupdate(self, json_result, s3_bucket, s3_key, drop=None, write_anyway=False, **write_kwargs):
+		digest = Utils.json_digest(json_result, drop=drop)
+		if write_anyway or not await self.json_already_exists(
+				json_result, s3_bucket, s3_key, drop=drop, digest=digest
+		):
+			await self.write_s3_file(
+				s3_bucket,
+				s3_key,
+				json.dumps(json_result, ensure_ascii=False),
+				metadata=S3Utils.digest_metadata(digest, drop),
+				**write_kwargs
+			)
+			return True
+		return False
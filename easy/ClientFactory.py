@@ -0,0 +1,75 @@
+import threading
+
+
+class ClientFactory:
+	"""
+	Process-wide, thread-safe cache of boto3 sessions and clients: a client is created
+	once for each (service, region, profile) and then shared (boto3 clients are
+	thread-safe), so a warm Lambda never pays the client creation again.
+	Clients are created with a botocore Config tuning the connection pool
+	(DEFAULT_CONFIG, overridden by the config_kwargs of the first get_client call).
+		>>> logs = ClientFactory.get_client('logs', region_name='eu-west-1')
+		>>> EasyCloudWatch('my-group', 'my-stream', logs_client=logs)
+	"""
+	DEFAULT_CONFIG = {
+		'max_pool_connections': 50,
+		'retries': {'mode': 'standard', 'max_attempts': 5},
+		'tcp_keepalive': True,
+	}
+
+	_sessions = {}
+	_clients = {}
+	_lock = threading.Lock()
+
+	@classmethod
+	def get_session(cls, profile_name=None):
+		"""
+		:param profile_name: aws profile (None for the default credentials chain)
+		:return: the shared boto3.Session of profile_name
+		"""
+		with cls._lock:
+			return cls._get_session(profile_name)
+
+	@classmethod
+	def _get_session(cls, profile_name):
+		session = cls._sessions.get(profile_name)
+		if session is None:
+			import boto3
+			session = boto3.Session(profile_name=profile_name)
+			cls._sessions[profile_name] = session
+		return session
+
+	@classmethod
+	def get_client(cls, service_name, region_name=None, profile_name=None, **config_kwargs):
+		"""
+		:param service_name: aws service (e.g. 'logs', 'lambda', 's3')
+		:param region_name: aws region (None for the region of the profile)
+		:param profile_name: aws profile (None for the default credentials chain)
+		:param config_kwargs: botocore Config arguments (e.g. max_pool_connections),
+			used only when the client is created
+		:return: the shared client
+		"""
+		key = (service_name, region_name, profile_name)
+		client = cls._clients.get(key)
+		if client is not None:
+			return client
+
+		from botocore.config import Config
+
+		with cls._lock:
+			client = cls._clients.get(key)
+			if client is None:
+				# sessions are not thread-safe: clients are created under the lock
+				client = cls._get_session(profile_name).client(
+					service_name,
+					region_name=region_name,
+					config=Config(**dict(cls.DEFAULT_CONFIG, **config_kwargs))
+				)
+				cls._clients[key] = client
+			return client
+
+	@classmethod
+	def clear(cls):
+		with cls._lock:
+			cls._sessions = {}
+			cls._clients = {}
@@ -1,19 +1,49 @@
-import boto3
+import logging
+import queue
+import random
+import threading
 import time
+import weakref
+
+from easy.ClientFactory import ClientFactory
 
 
 class EasyCloudWatch:
-	def __init__(self, log_group, log_stream, retention_in_days=365, profile_name=None):
+	# client -> (log group, log stream) already created by this process through it: a
+	# client has a single region and credentials, so another account is provisioned again
+	_provisioned = weakref.WeakKeyDictionary()
+	_provisioned_lock = threading.Lock()
+
+	def __init__(self, log_group, log_stream, retention_in_days=365, profile_name=None, logs_client=None):
+		"""
+		:param log_group: log group, created (with retention_in_days) if it does not exist
+		:param log_stream: log stream, created if it does not exist
+		:param retention_in_days: retention of the log group
+		:param profile_name: aws profile (optional)
+		:param logs_client: logs client to use (default the shared one of ClientFactory)
+		"""
 		self.log_group = log_group
 		self.log_stream = log_stream
 
-		if profile_name:
-			session = boto3.Session(profile_name=profile_name)
-			self.logs = session.client('logs')
+		if logs_client is not None:
+			self.logs = logs_client
+		elif profile_name:
+			self.logs = ClientFactory.get_client('logs', profile_name=profile_name)
 		else:
-			self.logs = boto3.client('logs', region_name='eu-west-1')
+			self.logs = ClientFactory.get_client('logs', region_name='eu-west-1')
 
 		self.next_token = None
+		provision_key = (self.log_group, self.log_stream)
+		# an already provisioned stream is not checked again: a stale sequence token
+		# is fixed by put_log_batch
+		with self._provisioned_lock:
+			provisioned = provision_key in self._provisioned.get(self.logs, ())
+		if not provisioned:
+			self._provision(retention_in_days)
+			with self._provisioned_lock:
+				self._provisioned.setdefault(self.logs, set()).add(provision_key)
+
+	def _provision(self, retention_in_days):
 		try:
 			self.logs.create_log_group(logGroupName=self.log_group)
 		except self.logs.exceptions.ResourceAlreadyExistsException:
@@ -40,18 +70,213 @@ class EasyCloudWatch:
 		timestamp = int(round(time.time() * 1000))
 		datetime_str = time.strftime('%Y-%m-%d %H:%M:%S')
 
+		return self.put_log_batch([
+			{
+				'timestamp': timestamp,
+				'message': f'{datetime_str}\t{message}'
+			}
+		])
+
+	def put_log_batch(self, log_events):
+		"""
+		send many events with a single PutLogEvents call. The events are sorted by
+		timestamp; the caller must respect the PutLogEvents limits (see EasyCloudWatchHandler)
+		:param log_events: list of {'timestamp': epoch millis, 'message': str}
+		:return: the PutLogEvents response
+		"""
 		put_log_args = dict(
 			logGroupName=self.log_group,
 			logStreamName=self.log_stream,
-			logEvents=[
-					{
-						'timestamp': timestamp,
-						'message': f'{datetime_str}\t{message}'
-					}
-				],
+			logEvents=sorted(log_events, key=lambda e: e['timestamp']),
 			sequenceToken=self.next_token
 		)
 
-		response = self.logs.put_log_events(**{k: v for k, v in put_log_args.items() if v is not None})
-		self.next_token = response['nextSequenceToken']
+		try:
+			response = self.logs.put_log_events(**{k: v for k, v in put_log_args.items() if v is not None})
+		except self.logs.exceptions.InvalidSequenceTokenException as e:
+			# the stream has been written by someone else: retry with the expected token
+			put_log_args['sequenceToken'] = e.response.get('expectedSequenceToken')
+			response = self.logs.put_log_events(**{k: v for k, v in put_log_args.items() if v is not None})
+		except self.logs.exceptions.DataAlreadyAcceptedException as e:
+			self.next_token = e.response.get('expectedSequenceToken')
+			return e.response
+
+		self.next_token = response.get('nextSequenceToken')
 		return response
+
+
+class EasyCloudWatchHandler(logging.Handler):
+	"""
+	logging.Handler that sends the records to an EasyCloudWatch stream in batches.
+	emit only enqueues the record: a background thread sends the batches when
+	max_batch_count events or max_batch_bytes bytes are queued, every flush_interval
+	seconds and on flush/close (called by logging at shutdown).
+	Batches respect the PutLogEvents limits, failed calls are retried with exponential
+	backoff and the events that cannot be sent (queue full or retries exhausted) are
+	counted in `dropped`.
+		>>> handler = EasyCloudWatchHandler(EasyCloudWatch('my-group', 'my-stream'))
+		>>> logging.getLogger().addHandler(handler)
+	"""
+	MAX_BATCH_COUNT = 10000
+	MAX_BATCH_BYTES = 1048576
+	EVENT_OVERHEAD_BYTES = 26
+	MAX_EVENT_BYTES = 262144
+	MAX_BATCH_SPAN_MS = 24 * 60 * 60 * 1000
+
+	def __init__(
+			self,
+			easy_cloudwatch,
+			level=logging.NOTSET,
+			flush_interval=5,
+			max_batch_count=MAX_BATCH_COUNT,
+			max_batch_bytes=MAX_BATCH_BYTES,
+			queue_size=100000,
+			max_retries=5,
+			backoff_factor=0.5
+	):
+		"""
+		:param easy_cloudwatch: an EasyCloudWatch
+		:param level: logging level
+		:param flush_interval: max seconds an event waits before being sent
+		:param max_batch_count: max events in a batch (at most 10000)
+		:param max_batch_bytes: max bytes of a batch (at most 1048576)
+		:param queue_size: max events waiting to be sent; newer events are dropped when full
+		:param max_retries: retries of a failed PutLogEvents call
+		:param backoff_factor: the i-th retry waits backoff_factor * 2**i seconds (plus jitter)
+		"""
+		super().__init__(level)
+		self.cloudwatch = easy_cloudwatch
+		self.flush_interval = flush_interval
+		self.max_batch_count = min(max_batch_count, self.MAX_BATCH_COUNT)
+		self.max_batch_bytes = min(max_batch_bytes, self.MAX_BATCH_BYTES)
+		self.max_retries = max_retries
+		self.backoff_factor = backoff_factor
+
+		self.sent = 0
+		self.dropped = 0
+		self._counters_lock = threading.Lock()
+
+		self._queue = queue.Queue(maxsize=queue_size)
+		self._closing = threading.Event()
+		self._thread = threading.Thread(target=self._run, name='EasyCloudWatchHandler', daemon=True)
+		self._thread.start()
+
+	def emit(self, record):
+		if threading.get_ident() == self._thread.ident:
+			# records logged while sending (e.g. by botocore) would feed back forever
+			return
+		try:
+			message = self.format(record)
+			max_bytes = self.MAX_EVENT_BYTES - self.EVENT_OVERHEAD_BYTES
+			if len(message) * 4 > max_bytes:
+				message = message.encode('utf-8')[:max_bytes].decode('utf-8', 'ignore')
+			event = {'timestamp': int(record.created * 1000), 'message': message}
+		except Exception:
+			self.handleError(record)
+			return
+
+		try:
+			self._queue.put_nowait(event)
+		except queue.Full:
+			self._count(dropped=1)
+
+	def flush(self, timeout=30):
+		"""
+		wait until the events queued so far have been sent (or dropped)
+		"""
+		if not self._thread.is_alive():
+			return
+		done = threading.Event()
+		try:
+			self._queue.put(done, timeout=timeout)
+		except queue.Full:
+			return
+		done.wait(timeout)
+
+	def close(self):
+		if not self._closing.is_set():
+			self._closing.set()
+			self.flush()
+			self._thread.join(self.flush_interval + 1)
+		super().close()
+
+	def _run(self):
+		pending = []
+		pending_bytes = 0
+		# events wait at most flush_interval seconds from when the oldest was queued
+		oldest_time = None
+
+		while True:
+			flush_events = []
+			if pending:
+				timeout = max(0.0, oldest_time + self.flush_interval - time.monotonic())
+			else:
+				timeout = self.flush_interval
+			try:
+				item = self._queue.get(timeout=timeout)
+				while True:
+					if isinstance(item, threading.Event):
+						flush_events.append(item)
+					else:
+						if not pending:
+							oldest_time = time.monotonic()
+						pending.append(item)
+						pending_bytes += len(item['message'].encode('utf-8')) + self.EVENT_OVERHEAD_BYTES
+					if len(pending) >= self.max_batch_count or pending_bytes >= self.max_batch_bytes:
+						break
+					item = self._queue.get_nowait()
+			except queue.Empty:
+				pass
+
+			if pending and (
+					flush_events
+					or self._closing.is_set()
+					or len(pending) >= self.max_batch_count
+					or pending_bytes >= self.max_batch_bytes
+					or time.monotonic() - oldest_time >= self.flush_interval
+			):
+				self._send(pending)
+				pending = []
+				pending_bytes = 0
+
+			for flush_event in flush_events:
+				flush_event.set()
+
+			if self._closing.is_set() and self._queue.empty() and not pending:
+				return
+
+	def _count(self, sent=0, dropped=0):
+		with self._counters_lock:
+			self.sent += sent
+			self.dropped += dropped
+
+	def _batches(self, events):
+		batch = []
+		batch_bytes = 0
+		for event in sorted(events, key=lambda e: e['timestamp']):
+			event_bytes = len(event['message'].encode('utf-8')) + self.EVENT_OVERHEAD_BYTES
+			if batch and (
+					len(batch) >= self.max_batch_count
+					or batch_bytes + event_bytes > self.max_batch_bytes
+					or event['timestamp'] - batch[0]['timestamp'] > self.MAX_BATCH_SPAN_MS
+			):
+				yield batch
+				batch = []
+				batch_bytes = 0
+			batch.append(event)
+			batch_bytes += event_bytes
+		if batch:
+			yield batch
+
+	def _send(self, events):
+		for batch in self._batches(events):
+			for attempt in range(self.max_retries + 1):
+				try:
+					self.cloudwatch.put_log_batch(batch)
+					self._count(sent=len(batch))
+					break
+				except Exception:
+					if attempt == self.max_retries:
+						self._count(dropped=len(batch))
+					else:
+						time.sleep(self.backoff_factor * 2 ** attempt * (1 + random.random()))
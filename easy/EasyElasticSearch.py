@@ -1,9 +1,21 @@
-import boto3
+import itertools
+import queue
+import random
+import threading
+import time
 from requests_aws4auth import AWS4Auth
-from elasticsearch import Elasticsearch, RequestsHttpConnection
+from elasticsearch import Elasticsearch, RequestsHttpConnection, helpers
+from elasticsearch.exceptions import TransportError
+
+from easy.ClientFactory import ClientFactory
+from easy.Instrumentation import Instrumentation
+from easy.Utils import Utils, S3Utils, TTLCache
 
 
 class EasyElasticSearch:
+	# bulk rejections retried with backoff (too many requests, service unavailable)
+	RETRY_STATUSES = (429, 503)
+
 	def __init__(
 			self,
 			host,
@@ -12,42 +24,365 @@ class EasyElasticSearch:
 			region='eu-west-1',
 			profile_name=None,
 			maxsize=30,
+			cache_size=0,
+			cache_ttl=60,
+			es_client=None,
 			**kwargs
 	):
-		boto_session = boto3.Session(profile_name=profile_name) if boto_session is None else boto_session
-		credentials = boto_session.get_credentials()
-
-		awsauth = AWS4Auth(
-			credentials.access_key,
-			credentials.secret_key,
-			region,
-			'es',
-			session_token=credentials.token
-		)
+		"""
+		:param host:
+		:param port:
+		:param boto_session: boto3 session with the credentials (default the shared one of ClientFactory)
+		:param region:
+		:param profile_name:
+		:param maxsize: size of the connection pool
+		:param cache_size: max documents kept in the get/mget cache (0 disables the cache)
+		:param cache_ttl: seconds a document is kept in the cache
+		:param es_client: Elasticsearch client to use (e.g. shared by many instances);
+			when given the connection arguments are ignored
+		:param kwargs: other arguments of Elasticsearch
+		"""
 		self.host = host
 		self.port = port
+		self.maxsize = maxsize
+		# NOTE: cached documents are shared between callers: do not modify them
+		self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl) if cache_size else None
+		if self.cache is not None:
+			Instrumentation.register_cache('es.documents', self.cache.stats)
 
-		self.es = Elasticsearch(
-			hosts=[{'host': host, 'port': port}],
-			http_auth=awsauth,
-			use_ssl=True,
-			verify_certs=True,
-			connection_class=RequestsHttpConnection,
-			maxsize=maxsize,
-			**kwargs
-		)
+		if es_client is None:
+			boto_session = ClientFactory.get_session(profile_name) if boto_session is None else boto_session
+			credentials = boto_session.get_credentials()
+
+			awsauth = AWS4Auth(
+				credentials.access_key,
+				credentials.secret_key,
+				region,
+				'es',
+				session_token=credentials.token
+			)
+			es_client = Elasticsearch(
+				hosts=[{'host': host, 'port': port}],
+				http_auth=awsauth,
+				use_ssl=True,
+				verify_certs=True,
+				connection_class=RequestsHttpConnection,
+				maxsize=maxsize,
+				**kwargs
+			)
+		self.es = es_client
 
 	def get_elastic_client(self):
 		return self.es
 
+	@Instrumentation.timed('es.get')
 	def get(self, index, identifier, doc_type=None, metadata=True):
-		result = self.es.get(index=index, id=identifier, doc_type=doc_type)
+		result = None if self.cache is None else self.cache.get((index, doc_type, identifier))
+		if result is None:
+			result = self.es.get(index=index, id=identifier, doc_type=doc_type)
+			if self.cache is not None:
+				self.cache.set((index, doc_type, identifier), result)
 		return result if metadata else result['_source']
 
+	@Instrumentation.timed('es.mget')
+	def mget(self, index, identifiers, doc_type=None, metadata=True, chunk_size=1000):
+		"""
+		get many documents with mget requests of at most chunk_size ids (cached
+		documents are not requested)
+			>>> docs, missing = es.mget('contents', ['F1', 'F2', 'F3'])
+			>>> missing
+			>>> ['F3']  # docs[2] is None
+		:param index: elasticsearch index
+		:param identifiers: list of document ids
+		:param doc_type:
+		:param metadata: if False only the _source of the documents is returned
+		:param chunk_size: max ids in a single mget request
+		:return: a tuple (documents, missing): documents has the same order of identifiers,
+			with None for the missing ones, which are listed in missing
+		"""
+		found = {}
+		to_fetch = []
+		for identifier in dict.fromkeys(identifiers):
+			result = None if self.cache is None else self.cache.get((index, doc_type, identifier))
+			if result is None:
+				to_fetch.append(identifier)
+			else:
+				found[identifier] = result
+
+		for i in range(0, len(to_fetch), chunk_size):
+			chunk = to_fetch[i:i + chunk_size]
+			response = self.es.mget(body={'ids': chunk}, index=index, doc_type=doc_type)
+			for identifier, result in zip(chunk, response['docs']):
+				if result.get('found'):
+					found[identifier] = result
+					if self.cache is not None:
+						self.cache.set((index, doc_type, identifier), result)
+
+		documents = []
+		missing = []
+		for identifier in identifiers:
+			result = found.get(identifier)
+			if result is None:
+				missing.append(identifier)
+				documents.append(None)
+			else:
+				documents.append(result if metadata else result['_source'])
+		return documents, missing
+
+	@Instrumentation.timed('es.index')
 	def index(self, index, body, identifier, doc_type=None):
-		return self.es.index(
+		result = self.es.index(
 			index=index,
 			body=body,
 			id=identifier,
 			doc_type=doc_type,
 		)
+		if self.cache is not None:
+			self.cache.delete((index, doc_type, identifier))
+		return result
+
+	def bulk_index(
+			self,
+			index,
+			documents,
+			id_field=None,
+			doc_type=None,
+			chunk_size=500,
+			max_chunk_bytes=10 * 1024 * 1024,
+			thread_count=4,
+			max_retries=3,
+			initial_backoff=2,
+			max_backoff=60
+	):
+		"""
+		Index a stream of documents with bulk requests of at most chunk_size documents
+		and max_chunk_bytes bytes, sent by thread_count threads (bounded by the
+		connection pool maxsize). Rejections (429/503) of a whole request or of single
+		documents are retried with exponential backoff; other failures are reported
+		and do not stop the stream.
+			>>> for ok, item in es.bulk_index('contents', docs, id_field='id'):
+			>>> 	if not ok:
+			>>> 		logger.error(item)
+
+		:param index: elasticsearch index
+		:param documents: iterable of documents: (identifier, body) tuples or dictionaries
+			(identified by body[id_field], or by elasticsearch if id_field is None)
+		:param id_field: field of the documents used as identifier
+		:param doc_type:
+		:param chunk_size: max documents in a bulk request
+		:param max_chunk_bytes: max bytes of a bulk request
+		:param thread_count: number of parallel bulk requests
+		:param max_retries: max retries of rejected documents
+		:param initial_backoff: seconds waited before the first retry (doubled at each retry)
+		:param max_backoff: max seconds waited before a retry
+		:return: generator of (ok, item) tuples, one per document (NOT in input order),
+			where item is the bulk response item, e.g. {'index': {'_id': ..., 'status': 201, ...}}
+		"""
+		chunks = self._bulk_chunks(index, documents, id_field, doc_type, chunk_size, max_chunk_bytes)
+		thread_count = max(1, min(thread_count, self.maxsize))
+
+		def send(chunk):
+			return self._send_bulk_chunk(chunk, max_retries, initial_backoff, max_backoff)
+
+		for _, future in Utils.map_unordered(send, chunks, thread_count):
+			for result in future.result():
+				if self.cache is not None:
+					self.cache.delete((index, doc_type, result[1]['index'].get('_id')))
+				yield result
+
+	def _bulk_chunks(self, index, documents, id_field, doc_type, chunk_size, max_chunk_bytes):
+		serializer = self.es.transport.serializer
+		chunk = []
+		chunk_bytes = 0
+		for document in documents:
+			if isinstance(document, tuple):
+				identifier, body = document
+			else:
+				identifier, body = (None if id_field is None else document[id_field]), document
+
+			action = {'_index': index}
+			if identifier is not None:
+				action['_id'] = identifier
+			if doc_type is not None:
+				action['_type'] = doc_type
+
+			lines = (serializer.dumps({'index': action}), serializer.dumps(body))
+			lines_bytes = len(lines[0].encode('utf-8')) + len(lines[1].encode('utf-8')) + 2
+			if chunk and (len(chunk) >= chunk_size or chunk_bytes + lines_bytes > max_chunk_bytes):
+				yield chunk
+				chunk = []
+				chunk_bytes = 0
+			chunk.append((identifier, lines))
+			chunk_bytes += lines_bytes
+		if chunk:
+			yield chunk
+
+	@Instrumentation.timed('es.bulk')
+	def _send_bulk_chunk(self, chunk, max_retries, initial_backoff, max_backoff):
+		results = []
+		for attempt in range(max_retries + 1):
+			if attempt > 0:
+				Instrumentation.count('es.bulk_retries')
+				backoff = min(max_backoff, initial_backoff * 2 ** (attempt - 1))
+				time.sleep(backoff * random.uniform(0.5, 1))
+
+			is_last_attempt = attempt == max_retries
+			body = '\n'.join(itertools.chain.from_iterable(lines for _, lines in chunk)) + '\n'
+			Instrumentation.count('es.bulk_documents', len(chunk))
+			try:
+				response = self.es.bulk(body=body)
+			except TransportError as e:
+				if e.status_code in self.RETRY_STATUSES and not is_last_attempt:
+					continue
+				results.extend(
+					(False, {'index': {'_id': identifier, 'status': e.status_code, 'error': str(e)}})
+					for identifier, _ in chunk
+				)
+				return results
+
+			to_retry = []
+			for (identifier, lines), item in zip(chunk, response['items']):
+				op_result = next(iter(item.values()))
+				ok = 200 <= op_result.get('status', 500) < 300
+				if not ok and op_result.get('status') in self.RETRY_STATUSES and not is_last_attempt:
+					to_retry.append((identifier, lines))
+				else:
+					results.append((ok, item))
+
+			if not to_retry:
+				return results
+			chunk = to_retry
+		return results
+
+	def scan(self, index, query=None, page_size=1000, source=None, slices=1, keep_alive='5m'):
+		"""
+		Generator of all the hits of index matching query, read page by page with
+		search_after on a point in time (or with a scroll if the cluster does not
+		support it). With slices > 1 the index is read by `slices` threads in
+		parallel (sliced search) and the hits are yielded as they arrive.
+			>>> for hit in es.scan('contents', {'term': {'tipologia': 'film'}}, source=['titolo']):
+			>>> 	print(hit['_id'], hit['_source'])
+
+		:param index: elasticsearch index
+		:param query: elasticsearch query (default match_all)
+		:param page_size: hits returned by each request
+		:param source: _source filtering (e.g. a list of fields, False for no source)
+		:param slices: number of parallel slices
+		:param keep_alive: keep alive of the point in time / scroll
+		:return: generator of hits
+		"""
+		body = {'query': query if query is not None else {'match_all': {}}}
+		if source is not None:
+			body['_source'] = source
+
+		try:
+			pit_id = self.es.open_point_in_time(index=index, keep_alive=keep_alive)['id']
+		except TransportError:
+			pit_id = None
+
+		try:
+			if slices <= 1:
+				yield from self._scan_slice(index, body, page_size, keep_alive, pit_id)
+			else:
+				yield from self._scan_slices(index, body, page_size, keep_alive, pit_id, slices)
+		finally:
+			if pit_id is not None:
+				try:
+					self.es.close_point_in_time(body={'id': pit_id})
+				except TransportError:
+					pass
+
+	def _scan_slice(self, index, body, page_size, keep_alive, pit_id, slice_id=None, slices=None):
+		body = dict(body)
+		if slice_id is not None:
+			body['slice'] = {'id': slice_id, 'max': slices}
+
+		if pit_id is not None:
+			body.update(
+				size=page_size,
+				sort=[{'_shard_doc': 'asc'}],
+				pit={'id': pit_id, 'keep_alive': keep_alive},
+				track_total_hits=False
+			)
+			first_page = True
+			while True:
+				try:
+					with Instrumentation.timer('es.scan_page'):
+						response = self.es.search(body=body)
+				except TransportError as e:
+					# e.g. clusters without _shard_doc or sliced point in time: use a scroll
+					if first_page and e.status_code == 400:
+						body = {k: v for k, v in body.items() if k not in ['size', 'sort', 'pit', 'track_total_hits']}
+						break
+					raise e
+				first_page = False
+
+				hits = response['hits']['hits']
+				yield from hits
+				if len(hits) < page_size:
+					return
+				body['search_after'] = hits[-1]['sort']
+				body['pit'] = {'id': response.get('pit_id', body['pit']['id']), 'keep_alive': keep_alive}
+
+		yield from helpers.scan(self.es, query=body, index=index, size=page_size, scroll=keep_alive)
+
+	def _scan_slices(self, index, body, page_size, keep_alive, pit_id, slices):
+		hits_queue = queue.Queue(maxsize=page_size * slices)
+		stop = threading.Event()
+		done = object()
+
+		def put(item):
+			while not stop.is_set():
+				try:
+					hits_queue.put(item, timeout=1)
+					return True
+				except queue.Full:
+					pass
+			return False
+
+		def read_slice(slice_id):
+			try:
+				for hit in self._scan_slice(index, body, page_size, keep_alive, pit_id, slice_id, slices):
+					if not put(hit):
+						return
+				put(done)
+			except Exception as e:
+				put(e)
+
+		threads = [threading.Thread(target=read_slice, args=(i,), daemon=True) for i in range(slices)]
+		for t in threads:
+			t.start()
+
+		try:
+			running = slices
+			while running:
+				item = hits_queue.get()
+				if item is done:
+					running -= 1
+				elif isinstance(item, Exception):
+					raise item
+				else:
+					yield item
+		finally:
+			stop.set()
+			for t in threads:
+				t.join()
+
+	def export_json_lines(self, target, index, query=None, s3=None, metadata=False, **scan_kwargs):
+		"""
+		Write all the documents of index matching query to a JSON Lines file, local
+		or on s3 (s3://bucket/key, written with a multipart upload), gzipped if
+		target ends with .gz. Documents are streamed, so memory usage does not depend
+		on the size of the index.
+			>>> es.export_json_lines('s3://bucket/snapshot/contents.jsonl.gz', 'contents', s3=s3, slices=4)
+		:param target: local path or s3://bucket/key
+		:param index: elasticsearch index
+		:param query: elasticsearch query (default match_all)
+		:param s3: s3 object (needed for s3 targets)
+		:param metadata: if False only the _source of the documents is written
+		:param scan_kwargs: other arguments of scan (page_size, source, slices, keep_alive)
+		:return: number of documents written
+		"""
+		hits = self.scan(index, query=query, **scan_kwargs)
+		records = hits if metadata else (hit.get('_source', {}) for hit in hits)
+		return S3Utils.write_json_lines(records, target, s3=s3)
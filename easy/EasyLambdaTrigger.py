@@ -1,9 +1,20 @@
-import boto3
+import logging
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+from easy.ClientFactory import ClientFactory
 
 
 class EasyLambdaTrigger:
-	def __init__(self, lambda_name, region_name='eu-west-1'):
+	def __init__(self, lambda_name, region_name='eu-west-1', lambda_client=None, **waiter_kwargs):
+		"""
+		:param lambda_name: name of the lambda function
+		:param region_name: aws region
+		:param lambda_client: lambda client to use (default the shared one of ClientFactory)
+		:param waiter_kwargs: arguments of the EventSourceWaiter used by wait_state(s)
+			(initial_delay, max_delay, backoff_factor, max_poll_rate)
+		"""
 		self.ENABLING = 'Enabling'
 		self.ENABLED = 'Enabled'
 		self.DISABLING = 'Disabling'
@@ -12,7 +23,8 @@ class EasyLambdaTrigger:
 			self.ENABLING, self.ENABLED, self.DISABLING, self.DISABLED
 		]
 		self.lambda_name = lambda_name
-		self.lambda_client = boto3.client(service_name='lambda', region_name=region_name)
+		self.lambda_client = lambda_client or ClientFactory.get_client('lambda', region_name=region_name)
+		self.waiter_kwargs = waiter_kwargs
 
 	def get_event_sources(self):
 		event_source_mapping = self.lambda_client.list_event_source_mappings(FunctionName=self.lambda_name)
@@ -21,6 +33,12 @@ class EasyLambdaTrigger:
 	def get_event_sources_uuid(self):
 		return [e['UUID'] for e in self.get_event_sources()]
 
+	def get_event_source_states(self):
+		"""
+		:return: dict uuid -> state of all the event source mappings, with a single call
+		"""
+		return {e['UUID']: e['State'] for e in self.get_event_sources()}
+
 	def get_event_source_state(self, trigger_uuid):
 		return self.lambda_client.get_event_source_mapping(UUID=trigger_uuid)['State']
 
@@ -54,16 +72,287 @@ class EasyLambdaTrigger:
 
 		return self.get_event_source_state(trigger_uuid)
 
-	def wait_state(self, trigger_uuid, state, timeout=180):
+	def wait_state(self, trigger_uuid, state, timeout=180, callback=None):
+		"""
+		wait until the event source mapping trigger_uuid reaches state
+		:param callback: function(trigger_uuid, state) called when state is reached
+		:return: the reached state
+		"""
+		return self.wait_states([trigger_uuid], state, timeout, callback)[trigger_uuid]
+
+	def wait_states(self, trigger_uuids, state, timeout=180, callback=None):
+		"""
+		wait until all the event source mappings trigger_uuids reach state, polling
+		them in a single loop with exponential backoff
+			>>> lambda_trigger.wait_states(lambda_trigger.get_event_sources_uuid(), lambda_trigger.ENABLED)
+		:param callback: function(trigger_uuid, state) called as soon as a mapping reaches state
+		:return: dict trigger_uuid -> reached state
+		"""
 		if state not in self._state_values:
 			error_msg = f"The only state values are: {','.join(self._state_values)}"
 			raise ValueError(error_msg)
 
-		start_time = time.time()
+		waiter = EventSourceWaiter(self.get_event_source_state, callback=callback, **self.waiter_kwargs)
+		return waiter.wait({trigger_uuid: state for trigger_uuid in trigger_uuids}, timeout)
+
+
+class EventSourceWaiter:
+	"""
+	Poll the state of many event source mappings until each reaches its target state.
+	Between two polling rounds the waiter sleeps with exponential backoff and jitter
+	(initial_delay, initial_delay * backoff_factor, ... up to max_delay) and the single
+	get_state calls never exceed max_poll_rate calls per second.
+		>>> waiter = EventSourceWaiter(lambda_trigger.get_event_source_state, max_poll_rate=5)
+		>>> waiter.wait({uuid_1: 'Enabled', uuid_2: 'Disabled'}, timeout=180)
+	"""
+	def __init__(
+			self,
+			get_state_func,
+			initial_delay=0.5,
+			max_delay=10,
+			backoff_factor=2,
+			max_poll_rate=5,
+			callback=None,
+			get_states_func=None
+	):
+		"""
+		:param get_state_func: function(uuid) returning the current state
+		:param initial_delay: seconds between the first two polling rounds
+		:param max_delay: max seconds between two polling rounds
+		:param backoff_factor: multiplier of the delay after every round
+		:param max_poll_rate: max get_state_func calls per second
+		:param callback: function(uuid, state) called when a mapping reaches its state
+		:param get_states_func: function(uuids) returning a dict uuid -> current state, used
+			instead of get_state_func to read all the pending states with a single call
+		"""
+		self.get_state_func = get_state_func
+		self.get_states_func = get_states_func
+		self.initial_delay = initial_delay
+		self.max_delay = max_delay
+		self.backoff_factor = backoff_factor
+		self.max_poll_rate = max_poll_rate
+		self.callback = callback
+		self.polls = 0
+		self._last_poll = None
+		self._logger = logging.getLogger(self.__class__.__name__)
+
+	def _poll_states(self, uuids):
+		if self.get_states_func is not None:
+			self._throttle()
+			return self.get_states_func(uuids)
+		states = {}
+		for uuid in uuids:
+			self._throttle()
+			states[uuid] = self.get_state_func(uuid)
+		return states
+
+	def _throttle(self):
+		if self._last_poll is not None and self.max_poll_rate:
+			wait = self._last_poll + 1 / self.max_poll_rate - time.monotonic()
+			if wait > 0:
+				time.sleep(wait)
+		self._last_poll = time.monotonic()
+		self.polls += 1
+
+	def wait(self, target_states, timeout=180):
+		"""
+		:param target_states: dict uuid -> state to wait for
+		:param timeout: max seconds to wait
+		:return: dict uuid -> reached state
+		"""
+		deadline = time.monotonic() + timeout
+		pending = dict(target_states)
+		reached = {}
+		delay = self.initial_delay
+
 		while True:
-			current_state = self.get_event_source_state(trigger_uuid)
-			if current_state == state:
-				return current_state
-			elif time.time() - start_time > timeout:
-				error_msg = f'Timeout {timeout} secs reached. Cannot wait anymore: increase timeout value'
+			current_states = self._poll_states(list(pending))
+			for uuid, state in list(pending.items()):
+				current_state = current_states.get(uuid)
+				if current_state == state:
+					del pending[uuid]
+					reached[uuid] = current_state
+					if self.callback is not None:
+						self.callback(uuid, current_state)
+			if not pending:
+				return reached
+
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				error_msg = (
+					f'Timeout {timeout} secs reached waiting for {", ".join(pending)}. '
+					f'Cannot wait anymore: increase timeout value'
+				)
 				raise TimeoutError(error_msg)
+
+			sleep_time = delay / 2 + random.uniform(0, delay / 2)
+			self._logger.debug(f'{len(pending)} event sources not ready, next poll in {sleep_time:.2f} secs')
+			time.sleep(min(sleep_time, remaining))
+			delay = min(delay * self.backoff_factor, self.max_delay)
+
+
+class EasyLambdaFleet:
+	"""
+	Enable or disable the event source mappings of many lambda functions at once.
+	All the mappings (with their state) are read with a single paginated
+	ListEventSourceMappings pass, the updates run concurrently on a thread pool and
+	the wait polls the states of all the mappings together.
+		>>> fleet = EasyLambdaFleet(prefix='my-app-')
+		>>> summary = fleet.update_triggers(enable=False, wait=True)
+		>>> failed = [r for r in summary.values() if r['result'] in ['failed', 'timeout']]
+	"""
+	ENABLING = 'Enabling'
+	ENABLED = 'Enabled'
+	DISABLING = 'Disabling'
+	DISABLED = 'Disabled'
+
+	def __init__(
+			self,
+			function_names=None,
+			prefix=None,
+			region_name='eu-west-1',
+			max_workers=10,
+			lambda_client=None,
+			**waiter_kwargs
+	):
+		"""
+		:param function_names: names of the lambda functions
+		:param prefix: prefix of the names of the lambda functions (alternative to function_names)
+		:param region_name: aws region
+		:param lambda_client: lambda client to use (default the shared one of ClientFactory)
+		:param max_workers: max concurrent UpdateEventSourceMapping calls
+		:param waiter_kwargs: arguments of the EventSourceWaiter
+		"""
+		if (function_names is None) == (prefix is None):
+			raise ValueError('Exactly one of function_names and prefix is required')
+
+		self.function_names = None if function_names is None else set(function_names)
+		self.prefix = prefix
+		self.max_workers = max_workers
+		self.waiter_kwargs = waiter_kwargs
+		self.lambda_client = lambda_client or ClientFactory.get_client('lambda', region_name=region_name)
+		self._logger = logging.getLogger(self.__class__.__name__)
+
+	@staticmethod
+	def function_name(function_arn):
+		# arn:aws:lambda:region:account:function:name[:alias]
+		return function_arn.split(':')[6]
+
+	def _selected(self, function_name):
+		if self.function_names is not None:
+			return function_name in self.function_names
+		return function_name.startswith(self.prefix)
+
+	def get_event_sources(self):
+		"""
+		:return: the event source mappings of the selected functions
+		"""
+		paginator = self.lambda_client.get_paginator('list_event_source_mappings')
+		return [
+			mapping
+			for page in paginator.paginate()
+			for mapping in page['EventSourceMappings']
+			if self._selected(self.function_name(mapping['FunctionArn']))
+		]
+
+	def get_event_source_states(self, trigger_uuids=None):
+		"""
+		:param trigger_uuids: uuids to return (default all)
+		:return: dict uuid -> state of the event source mappings of the selected functions
+		"""
+		states = {mapping['UUID']: mapping['State'] for mapping in self.get_event_sources()}
+		if trigger_uuids is None:
+			return states
+		return {uuid: states.get(uuid) for uuid in trigger_uuids}
+
+	def _wait(self, target_states, timeout, summary):
+		# wait for target_states, returning the uuids that did not reach their state
+		if not target_states:
+			return set()
+
+		def on_reached(uuid, state):
+			summary[uuid]['state'] = state
+
+		waiter = EventSourceWaiter(
+			None,
+			callback=on_reached,
+			get_states_func=self.get_event_source_states,
+			**self.waiter_kwargs
+		)
+		try:
+			waiter.wait(target_states, timeout)
+			return set()
+		except TimeoutError:
+			return {uuid for uuid in target_states if summary[uuid]['state'] != target_states[uuid]}
+
+	def _update(self, mapping, enable):
+		# no FunctionName: it would move a mapping of an alias or a version to $LATEST
+		self.lambda_client.update_event_source_mapping(UUID=mapping['UUID'], Enabled=enable)
+
+	def update_triggers(self, enable, timeout=180, wait=False):
+		"""
+		enable or disable all the event source mappings of the selected functions.
+		Mappings still moving to the opposite state are waited for before the update.
+		:param enable: True to enable, False to disable
+		:param timeout: max seconds of each wait
+		:param wait: if True wait until all the mappings reach the target state
+		:return: dict uuid -> {'function_name', 'previous_state', 'state', 'result', 'error'}
+			where result is one of unchanged, updated, failed, timeout
+		"""
+		if enable:
+			wait_if_before_state, wait_before_state = self.DISABLING, self.DISABLED
+			return_states, wait_state = [self.ENABLED, self.ENABLING], self.ENABLED
+		else:
+			wait_if_before_state, wait_before_state = self.ENABLING, self.ENABLED
+			return_states, wait_state = [self.DISABLED, self.DISABLING], self.DISABLED
+
+		mappings = self.get_event_sources()
+		summary = {
+			mapping['UUID']: {
+				'function_name': self.function_name(mapping['FunctionArn']),
+				'previous_state': mapping['State'],
+				'state': mapping['State'],
+				'result': 'unchanged',
+				'error': None
+			}
+			for mapping in mappings
+		}
+
+		transitioning = {
+			mapping['UUID']: wait_before_state
+			for mapping in mappings if mapping['State'] == wait_if_before_state
+		}
+		for uuid in self._wait(transitioning, timeout, summary):
+			summary[uuid]['result'] = 'timeout'
+			summary[uuid]['error'] = f'{wait_before_state} state not reached in {timeout} secs'
+
+		to_update = [
+			mapping for mapping in mappings
+			if summary[mapping['UUID']]['state'] not in return_states
+			and summary[mapping['UUID']]['result'] != 'timeout'
+		]
+		with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+			futures = {mapping['UUID']: executor.submit(self._update, mapping, enable) for mapping in to_update}
+		for uuid, future in futures.items():
+			try:
+				future.result()
+				summary[uuid]['result'] = 'updated'
+			except Exception as e:
+				self._logger.error(f'Cannot update event source mapping {uuid}: {e}')
+				summary[uuid]['result'] = 'failed'
+				summary[uuid]['error'] = str(e)
+
+		if wait:
+			targets = {
+				uuid: wait_state for uuid, result in summary.items()
+				if result['result'] in ['unchanged', 'updated']
+			}
+			for uuid in self._wait(targets, timeout, summary):
+				summary[uuid]['result'] = 'timeout'
+				summary[uuid]['error'] = f'{wait_state} state not reached in {timeout} secs'
+		else:
+			states = self.get_event_source_states(list(summary))
+			for uuid, result in summary.items():
+				result['state'] = states.get(uuid)
+
+		return summary
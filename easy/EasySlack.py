@@ -1,12 +1,29 @@
+import atexit
+import collections
+import logging
+import threading
+import time
+
 import slack
 from slack.errors import SlackApiError
 
 
 class EasySlack:
-	def __init__(self, app_name, token):
-		self.client = slack.WebClient(run_async=False, token=token)
+	def __init__(self, app_name, token, background=False, client=None, **notifier_kwargs):
+		"""
+		:param app_name: name prefixed to every message
+		:param token: slack token (not used if client is given)
+		:param background: if True track_message only enqueues the message, that is
+			sent by a SlackNotifier thread. WARNING: in AWS Lambda the environment is
+			frozen when the handler returns and atexit never runs, so call flush()
+			before returning or the queued messages can be lost
+		:param client: slack.WebClient to use (e.g. shared by many instances)
+		:param notifier_kwargs: arguments of SlackNotifier (queue_size, overflow, rate, ...)
+		"""
+		self.client = client or slack.WebClient(run_async=False, token=token)
 		self.app_name = app_name
 		self.no_msg_cnt = 0
+		self.notifier = SlackNotifier(self.send_message, **notifier_kwargs) if background else None
 
 	def send_message(self, channel, text):
 		self.client.chat_postMessage(
@@ -16,6 +33,10 @@ class EasySlack:
 
 	def track_message(self, logger_func, channel, text):
 		logger_func(text)
+		if self.notifier is not None:
+			self.notifier.submit(channel, text)
+			return
+
 		try:
 			if self.no_msg_cnt == 0:
 				self.send_message(channel, text)
@@ -26,3 +47,205 @@ class EasySlack:
 				self.no_msg_cnt = 100
 		except Exception:
 			pass
+
+	def flush(self, timeout=30):
+		if self.notifier is not None:
+			self.notifier.flush(timeout)
+
+	def close(self):
+		if self.notifier is not None:
+			self.notifier.close()
+
+
+class SlackNotifier:
+	"""
+	Background sender of Slack messages. submit only enqueues the message; a thread
+	sends it respecting, for each channel, a token bucket of `rate` messages per
+	second (bursts of `burst` messages) and the Retry-After of `ratelimited` errors.
+	The messages that pile up for a channel (e.g. while it is rate limited) are
+	merged into a single digest post of at most max_digest_messages messages.
+	When queue_size messages are pending, the overflow policy applies:
+		- 'drop_oldest': the oldest pending message of the channel is dropped
+		  (of the channel with more pending messages, if the channel has none)
+		- 'drop_new': the new message is dropped
+		- 'block': submit waits for free space (at most block_timeout seconds)
+	The thread is started by the first submit and exits once it has been idle for
+	idle_timeout seconds (or on close), so a notifier that is not closed does not
+	keep a thread alive. Pending messages are sent on close, which is registered
+	at exit while the thread runs.
+	"""
+	OVERFLOW_POLICIES = ['drop_oldest', 'drop_new', 'block']
+
+	def __init__(
+			self,
+			send_func,
+			queue_size=1000,
+			overflow='drop_oldest',
+			rate=1.0,
+			burst=3,
+			max_digest_messages=20,
+			block_timeout=5,
+			idle_timeout=60
+	):
+		"""
+		:param send_func: function(channel, text) sending a message
+		:param queue_size: max pending messages
+		:param overflow: policy applied when queue_size messages are pending
+		:param rate: messages per second for each channel
+		:param burst: max messages per channel sent without waiting
+		:param max_digest_messages: max messages merged in a digest post
+		:param block_timeout: max seconds submit waits with the 'block' policy
+		:param idle_timeout: seconds after which an idle thread exits (None never exits)
+		"""
+		if overflow not in self.OVERFLOW_POLICIES:
+			raise ValueError(f"The only overflow values are: {','.join(self.OVERFLOW_POLICIES)}")
+
+		self.send_func = send_func
+		self.queue_size = queue_size
+		self.overflow = overflow
+		self.rate = rate
+		self.burst = burst
+		self.max_digest_messages = max_digest_messages
+		self.block_timeout = block_timeout
+		self.idle_timeout = idle_timeout
+
+		self.sent = 0
+		self.dropped = 0
+
+		self._pending = collections.OrderedDict()
+		self._size = 0
+		self._sending = False
+		self._buckets = {}
+		self._paused_until = {}
+		self._closing = False
+		self._cond = threading.Condition()
+		self._thread = None
+		self._logger = logging.getLogger(self.__class__.__name__)
+
+	def submit(self, channel, text):
+		"""
+		:return: False if the message has been dropped
+		"""
+		with self._cond:
+			if self._size >= self.queue_size:
+				if self.overflow == 'drop_new':
+					self.dropped += 1
+					return False
+				elif self.overflow == 'block':
+					if not self._cond.wait_for(lambda: self._size < self.queue_size, self.block_timeout):
+						self.dropped += 1
+						return False
+				else:
+					drop_channel = channel if self._pending.get(channel) else max(
+						self._pending, key=lambda c: len(self._pending[c])
+					)
+					self._pending[drop_channel].popleft()
+					self._size -= 1
+					self.dropped += 1
+
+			self._pending.setdefault(channel, collections.deque()).append(text)
+			self._size += 1
+			self._cond.notify_all()
+			if self._thread is None:
+				self._thread = threading.Thread(target=self._run, name='SlackNotifier', daemon=True)
+				self._thread.start()
+				atexit.register(self.close)
+			return True
+
+	def flush(self, timeout=30):
+		"""
+		wait until all the pending messages have been sent (or dropped)
+		"""
+		with self._cond:
+			return self._cond.wait_for(lambda: self._size == 0 and not self._sending, timeout)
+
+	def close(self, timeout=30):
+		with self._cond:
+			self._closing = True
+			self._cond.notify_all()
+			thread = self._thread
+		if thread is not None:
+			thread.join(timeout)
+		atexit.unregister(self.close)
+
+	def _take_tokens(self, channel, now):
+		# refill the token bucket of channel; return the seconds to wait for a token
+		capacity = max(1, self.burst)
+		tokens, last_time = self._buckets.get(channel, (capacity, now))
+		tokens = min(capacity, tokens + (now - last_time) * self.rate)
+		if tokens >= 1:
+			self._buckets[channel] = (tokens - 1, now)
+			return 0
+		self._buckets[channel] = (tokens, now)
+		return (1 - tokens) / self.rate
+
+	def _next_batch(self):
+		now = time.monotonic()
+		min_wait = None
+		for channel, texts in self._pending.items():
+			if not texts:
+				continue
+			wait = self._paused_until.get(channel, 0) - now
+			if wait <= 0:
+				wait = self._take_tokens(channel, now)
+			if wait <= 0:
+				batch = [texts.popleft() for _ in range(min(len(texts), self.max_digest_messages))]
+				self._size -= len(batch)
+				return channel, batch, None
+			min_wait = wait if min_wait is None else min(min_wait, wait)
+		return None, None, min_wait
+
+	def _run(self):
+		while True:
+			with self._cond:
+				channel, texts, wait = self._next_batch()
+				while channel is None:
+					if self._size == 0:
+						if self._closing or not self._cond.wait_for(
+								lambda: self._size > 0 or self._closing, self.idle_timeout
+						):
+							# closed or idle: the next submit starts a new thread
+							self._thread = None
+							atexit.unregister(self.close)
+							return
+					else:
+						self._cond.wait(wait)
+					channel, texts, wait = self._next_batch()
+				self._sending = True
+			try:
+				self._send(channel, texts)
+			finally:
+				with self._cond:
+					self._sending = False
+					self._cond.notify_all()
+
+	def _send(self, channel, texts):
+		if len(texts) == 1:
+			text = texts[0]
+		else:
+			text = f'{len(texts)} messages:\n' + '\n'.join(f'• {t}' for t in texts)
+
+		try:
+			self.send_func(channel, text)
+			self.sent += len(texts)
+		except SlackApiError as e:
+			if e.response['error'] == 'ratelimited':
+				retry_after = int(e.response.headers.get('Retry-After', 1))
+				self._logger.warning(f'Slack channel {channel} rate limited for {retry_after} secs')
+				with self._cond:
+					self._paused_until[channel] = time.monotonic() + retry_after
+					# put back the messages (they will be part of the next digest) within
+					# queue_size: they are the oldest of the channel, so 'drop_oldest' drops
+					# the first ones, the other policies (the sender cannot block) the last ones
+					excess = self._size + len(texts) - self.queue_size
+					if excess > 0:
+						texts = texts[excess:] if self.overflow == 'drop_oldest' else texts[:len(texts) - excess]
+						self.dropped += excess
+					self._pending.setdefault(channel, collections.deque()).extendleft(reversed(texts))
+					self._size += len(texts)
+			else:
+				self._logger.error(f'Slack message to {channel} not sent: {e}')
+				self.dropped += len(texts)
+		except Exception as e:
+			self._logger.error(f'Slack message to {channel} not sent: {e}')
+			self.dropped += len(texts)
@@ -0,0 +1,222 @@
+import functools
+import json
+import os
+import threading
+import time
+import weakref
+
+
+class _NoTimer:
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		return False
+
+
+class _Timer:
+	def __init__(self, name):
+		self.name = name
+
+	def __enter__(self):
+		self._start = time.perf_counter()
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		Instrumentation.record_time(self.name, (time.perf_counter() - self._start) * 1000)
+		# a missing file is an expected outcome (counted by the probes as *_not_found)
+		if exc_type is not None and not issubclass(exc_type, FileNotFoundError):
+			Instrumentation.count(f'{self.name}.errors')
+		return False
+
+
+class Instrumentation:
+	"""
+	Opt-in, process-wide timers and counters of the hot paths (S3 reads/writes, MCM
+	reads, merge, normalize, fingerprint, elasticsearch calls) plus the hit rates of
+	the registered caches. It is disabled by default (every probe is then a single
+	attribute check); enable it with Instrumentation.enable() or with the environment
+	variable EASY_INSTRUMENTATION=1.
+		>>> Instrumentation.enable()
+		>>> mcm_helper.merge_one(fcode, common_metas)
+		>>> Instrumentation.snapshot()['timers']['s3.get']
+		>>> Instrumentation.export_emf(EasyCloudWatch('metrics', 'merge'), dimensions={'job': 'merge'})
+	"""
+	enabled = os.environ.get('EASY_INSTRUMENTATION', '').lower() in ['1', 'true']
+
+	_NO_TIMER = _NoTimer()
+	_timers = {}
+	_counters = {}
+	_caches = {}
+	_lock = threading.Lock()
+
+	@classmethod
+	def enable(cls):
+		cls.enabled = True
+
+	@classmethod
+	def disable(cls):
+		cls.enabled = False
+
+	@classmethod
+	def reset(cls):
+		"""
+		reset timers and counters (the registered caches are kept)
+		"""
+		with cls._lock:
+			cls._timers = {}
+			cls._counters = {}
+
+	@classmethod
+	def count(cls, name, value=1):
+		if not cls.enabled:
+			return
+		with cls._lock:
+			cls._counters[name] = cls._counters.get(name, 0) + value
+
+	@classmethod
+	def record_time(cls, name, elapsed_ms):
+		with cls._lock:
+			timer = cls._timers.get(name)
+			if timer is None:
+				cls._timers[name] = [1, elapsed_ms, elapsed_ms]
+			else:
+				timer[0] += 1
+				timer[1] += elapsed_ms
+				timer[2] = max(timer[2], elapsed_ms)
+
+	@classmethod
+	def timer(cls, name):
+		"""
+		context manager timing its block (errors but FileNotFoundError are counted in name.errors)
+			>>> with Instrumentation.timer('merge'):
+			>>> 	...
+		"""
+		return _Timer(name) if cls.enabled else cls._NO_TIMER
+
+	@staticmethod
+	def timed(name):
+		"""
+		decorator timing every call of the function
+		"""
+		def decorator(func):
+			@functools.wraps(func)
+			def wrapper(*args, **kwargs):
+				if not Instrumentation.enabled:
+					return func(*args, **kwargs)
+				with _Timer(name):
+					return func(*args, **kwargs)
+			return wrapper
+		return decorator
+
+	@classmethod
+	def register_cache(cls, name, stats_func):
+		"""
+		:param name: name of the cache in the snapshot
+		:param stats_func: function returning a dict with (at least) hits and misses,
+			or a functools cache_info; bound methods are held with a weak reference
+		"""
+		if hasattr(stats_func, '__func__'):
+			ref = weakref.WeakMethod(stats_func)
+		else:
+			ref = lambda: stats_func
+		with cls._lock:
+			cls._caches[name] = ref
+
+	@staticmethod
+	def _cache_stats(stats):
+		if hasattr(stats, '_asdict'):
+			stats = stats._asdict()
+		stats = dict(stats)
+		calls = stats['hits'] + stats['misses']
+		stats['hit_rate'] = stats['hits'] / calls if calls else 0.0
+		return stats
+
+	@classmethod
+	def snapshot(cls):
+		"""
+		:return: {'timers': {name: {count, total_ms, avg_ms, max_ms}}, 'counters': {name: value},
+			'caches': {name: {hits, misses, hit_rate, ...}}}
+		"""
+		with cls._lock:
+			timers = {name: list(timer) for name, timer in cls._timers.items()}
+			counters = dict(cls._counters)
+			caches = dict(cls._caches)
+
+		cache_stats = {}
+		for name, ref in caches.items():
+			stats_func = ref()
+			if stats_func is not None:
+				cache_stats[name] = cls._cache_stats(stats_func())
+
+		return {
+			'timers': {
+				name: {'count': count, 'total_ms': total, 'avg_ms': total / count, 'max_ms': max_ms}
+				for name, (count, total, max_ms) in timers.items()
+			},
+			'counters': counters,
+			'caches': cache_stats
+		}
+
+	@classmethod
+	def emf_lines(cls, namespace='EasyLibs', dimensions=None, snapshot=None, max_metrics=100):
+		"""
+		CloudWatch Embedded Metric Format documents of a snapshot: timers become
+		<name>.count and <name>.time (Milliseconds), counters <name>, caches
+		<name>.hits, <name>.misses and <name>.hit_rate (Percent)
+		:param namespace: CloudWatch namespace
+		:param dimensions: dict of dimension name -> value
+		:param snapshot: the snapshot to export (default the current one)
+		:param max_metrics: max metrics of a document (100 is the EMF limit)
+		:return: list of json strings
+		"""
+		snapshot = cls.snapshot() if snapshot is None else snapshot
+		dimensions = {} if dimensions is None else dimensions
+
+		metrics = []
+		for name, timer in snapshot['timers'].items():
+			metrics.append((f'{name}.count', timer['count'], 'Count'))
+			metrics.append((f'{name}.time', timer['total_ms'], 'Milliseconds'))
+		for name, value in snapshot['counters'].items():
+			metrics.append((name, value, 'Bytes' if name.endswith('bytes') else 'Count'))
+		for name, stats in snapshot['caches'].items():
+			metrics.append((f'{name}.hits', stats['hits'], 'Count'))
+			metrics.append((f'{name}.misses', stats['misses'], 'Count'))
+			metrics.append((f'{name}.hit_rate', stats['hit_rate'] * 100, 'Percent'))
+
+		timestamp = int(time.time() * 1000)
+		lines = []
+		for i in range(0, len(metrics), max_metrics):
+			chunk = metrics[i:i + max_metrics]
+			document = {
+				'_aws': {
+					'Timestamp': timestamp,
+					'CloudWatchMetrics': [{
+						'Namespace': namespace,
+						'Dimensions': [list(dimensions)],
+						'Metrics': [{'Name': name, 'Unit': unit} for name, _, unit in chunk]
+					}]
+				}
+			}
+			document.update(dimensions)
+			document.update({name: value for name, value, _ in chunk})
+			lines.append(json.dumps(document))
+		return lines
+
+	@classmethod
+	def export_emf(cls, easy_cloudwatch, namespace='EasyLibs', dimensions=None, reset=False):
+		"""
+		send the current snapshot to an EasyCloudWatch stream as EMF log events
+		:param easy_cloudwatch: an EasyCloudWatch
+		:param namespace: CloudWatch namespace
+		:param dimensions: dict of dimension name -> value
+		:param reset: reset timers and counters after the export
+		:return: the number of EMF documents sent
+		"""
+		lines = cls.emf_lines(namespace, dimensions)
+		if lines:
+			timestamp = int(time.time() * 1000)
+			easy_cloudwatch.put_log_batch([{'timestamp': timestamp, 'message': line} for line in lines])
+		if reset:
+			cls.reset()
+		return len(lines)
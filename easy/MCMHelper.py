@@ -1,17 +1,26 @@
+import copy
 import logging
 import json
+import threading
+from collections import namedtuple
 
-from easy.Utils import S3Utils, MetadataUtils, Utils
+from easy.Utils import Utils, S3Utils, MetadataUtils, ClearMeta
+from easy.MappingIndex import MappingIndex
+from easy.Instrumentation import Instrumentation
+
+MergeResult = namedtuple('MergeResult', ['fcode', 'document', 'error'])
 
 
 class MCMHelper:
-	def __init__(self, s3, data_conf, content_conf):
+	def __init__(self, s3, data_conf, content_conf, mapping_ttl=300):
 		self.data_conf = data_conf
 		self.content_conf = content_conf
+		self.mapping_ttl = mapping_ttl
 
 		self.s3 = s3
 		self._logger = logging.getLogger(self.__class__.__name__)
 
+	@Instrumentation.timed('mcm.read_mcm_content_season')
 	def read_mcm_content_season(self, content_id):
 		mcm_key_file = f"{self.data_conf['s3_mcm_season']}/{content_id}.json"
 		s3_bucket = self.data_conf['s3_bucket']
@@ -25,6 +34,7 @@ class MCMHelper:
 			self._logger.info(f'MCM season {content_id} NOT found!')
 			return None
 
+	@Instrumentation.timed('mcm.read_mcm_content_series')
 	def read_mcm_content_series(self, content_id):
 		mcm_key_file = f"{self.data_conf['s3_mcm_series']}/{content_id}.json"
 		s3_bucket = self.data_conf['s3_bucket']
@@ -38,6 +48,7 @@ class MCMHelper:
 			self._logger.info(f'MCM series {content_id} NOT found!')
 			return None
 
+	@Instrumentation.timed('mcm.read_mythem_series_js')
 	def read_mythem_series_js(self, series_id):
 		mythem_key_file = f"{self.data_conf['s3_mythematics_series_fingerprint']}/{series_id}.json"
 		s3_bucket = self.data_conf['s3_bucket']
@@ -51,6 +62,7 @@ class MCMHelper:
 			self._logger.info(f'MYTHEMATICS SERIES {series_id} NOT found!')
 			return None
 
+	@Instrumentation.timed('mcm.read_mythem_season_js')
 	def read_mythem_season_js(self, season_id):
 		mythem_key_file = f"{self.data_conf['s3_mythematics_season_fingerprint']}/{season_id}.json"
 		s3_bucket = self.data_conf['s3_bucket']
@@ -64,6 +76,7 @@ class MCMHelper:
 			self._logger.info(f'MYTHEMATICS SEASON {season_id} NOT found!')
 			return None
 
+	@Instrumentation.timed('mcm.read_mythem_js')
 	def read_mythem_js(self, content_id):
 		"""
 		Given an fcode return the dictionary (json) of the corresponding Mythematics len-10-Fcode content
@@ -82,6 +95,7 @@ class MCMHelper:
 			self._logger.info(f'MYTHEMATICS {content_id} NOT found!')
 			return None
 
+	@Instrumentation.timed('mcm.read_mythem_series_js_from_fcode')
 	def read_mythem_series_js_from_fcode(self, fcode):
 		"""
 		Given an Fcode this method find the corresponding id-series
@@ -95,8 +109,7 @@ class MCMHelper:
 			f'{s3_bucket}/{s3_fcode_serie_map}'
 		)
 		try:
-			fcode_serie_map = json.loads(S3Utils.read_s3_file(self.s3, s3_bucket, s3_fcode_serie_map))
-			idserie = fcode_serie_map['idserie'].get(fcode)
+			idserie = self._get_mapping_index('fcode_serie_mapping_path', 'idserie').get(fcode)
 		except FileNotFoundError:
 			self._logger.info(f'MYTHEMATICS {fcode} series NOT found: file {s3_bucket}/{s3_fcode_serie_map} not found')
 			return None
@@ -135,6 +148,7 @@ class MCMHelper:
 
 		return mcm_dict
 
+	@Instrumentation.timed('mcm.merge_mcm_mythem')
 	def merge_mcm_mythem(self, mythem_dict, mcm_dict, common_metas, sep='='):
 		"""
 		Given the dictionary of Mythematics and the dictionary of MCM
@@ -150,18 +164,13 @@ class MCMHelper:
 		clear_meta_name = 'clear_metas'
 		fing_name = 'fingerprint'
 
-		blacklist_meta = self.content_conf['blacklist_metas']
-		blacklist_metavalue = self.content_conf['blacklist_metavalues']
-
-		mythem_clear_meta = mythem_dict[clear_meta_name]
-		mcm_clear_meta = mcm_dict[clear_meta_name]
+		mythem_clear_meta = ClearMeta.from_list(mythem_dict[clear_meta_name], sep=sep)
+		mcm_clear_meta = ClearMeta.from_list(mcm_dict[clear_meta_name], sep=sep)
 
-		clear_meta_merged = MetadataUtils.merge_lst(common_metas, mcm_clear_meta, mythem_clear_meta, sep=sep)
-
-		clear_meta_merged = [
-			m for m in clear_meta_merged
-			if not Utils.isin(m[:m.index(sep)], blacklist_meta) and not Utils.isin(m[m.index(sep)+1:], blacklist_metavalue)
-		]
+		clear_meta_merged = mcm_clear_meta.merge(mythem_clear_meta, common_metas).filter(
+			blacklist_metas=self.content_conf['blacklist_metas'],
+			blacklist_metavalues=self.content_conf['blacklist_metavalues']
+		).to_list()
 
 		mcm_dict[clear_meta_name] = clear_meta_merged
 
@@ -237,23 +246,135 @@ class MCMHelper:
 
 		return self.merge_mcm_mythem(mythem_js, mcm_js, common_metas, sep=sep)
 
+	def _get_mcm_reader(self, mcm_reader):
+		if callable(mcm_reader):
+			return mcm_reader
+		if mcm_reader == 'season':
+			return self.read_mcm_content_season
+		if mcm_reader == 'series':
+			return self.read_mcm_content_series
+		raise ValueError(f"mcm_reader must be 'season', 'series' or a callable, not {mcm_reader!r}")
+
+	@Instrumentation.timed('mcm.merge_one')
+	def merge_one(self, fcode, common_metas, mcm_js=None, sep='=', mcm_reader='season'):
+		"""
+		Merge a single content: when mcm_js is not given the MCM json of fcode is read
+		by mcm_reader, then it is merged with Mythematics through search_mythematics_meta
+		:param fcode:
+		:param common_metas:
+		:param mcm_js: MCM dictionary of fcode (optional)
+		:param sep:
+		:param mcm_reader: 'season' (read from s3_mcm_season), 'series' (read from
+			s3_mcm_series) or a function fcode -> MCM dictionary (None if not found)
+		:return: the merged dictionary or None if the MCM content is not found
+		"""
+		if mcm_js is None:
+			mcm_js = self._get_mcm_reader(mcm_reader)(fcode)
+			if mcm_js is None:
+				return None
+
+		return self.search_mythematics_meta(fcode, mcm_js, common_metas, sep=sep)
+
+	def _thread_helper(self, local):
+		"""
+		boto3 resources are not thread-safe: every worker thread of merge_many gets a
+		copy of the helper with its own resource, built on the (thread-safe) client of self.s3
+		"""
+		helper = getattr(local, 'helper', None)
+		if helper is None:
+			helper = copy.copy(self)
+			helper.s3 = self.s3.__class__(client=self.s3.meta.client)
+			local.helper = helper
+		return helper
+
+	def _merge_in_thread(self, local, fcode, common_metas, mcm_js, sep, mcm_reader):
+		helper = self._thread_helper(local)
+		if isinstance(mcm_reader, str):
+			mcm_reader = helper._get_mcm_reader(mcm_reader)
+		return helper.merge_one(fcode, common_metas, mcm_js, sep, mcm_reader)
+
+	def merge_many(self, fcodes, common_metas, mcm_jss=None, sep='=', max_workers=16, mcm_reader='season'):
+		"""
+		Concurrent version of merge_one: the S3 reads of many contents run on a pool of
+		max_workers threads and the results are yielded as soon as they are ready
+		(so NOT in the order of fcodes). At most 2*max_workers contents are in flight,
+		so fcodes can be a generator of any length.
+		An error on a content does not stop the batch: it is reported in the `error`
+		field of its MergeResult.
+			>>> for res in helper.merge_many(fcodes, common_metas, mcm_reader='series'):
+			>>> 	if res.error is not None:
+			>>> 		logger.error(f'{res.fcode}: {res.error}')
+			>>> 	elif res.document is not None:
+			>>> 		write(res.document)
+
+		:param fcodes: iterable of fcodes
+		:param common_metas:
+		:param mcm_jss: dictionary fcode -> MCM dictionary (optional); the fcodes not
+			in mcm_jss are read by mcm_reader
+		:param sep:
+		:param max_workers: size of the thread pool
+		:param mcm_reader: 'season', 'series' or a function fcode -> MCM dictionary
+			(see merge_one); a function is called from the worker threads
+		:return: generator of MergeResult(fcode, document, error)
+		"""
+		self._get_mcm_reader(mcm_reader)
+		mcm_jss = {} if mcm_jss is None else mcm_jss
+		local = threading.local()
+
+		def merge(fcode):
+			return self._merge_in_thread(local, fcode, common_metas, mcm_jss.get(fcode), sep, mcm_reader)
+
+		for fcode, future in Utils.map_unordered(merge, fcodes, max_workers):
+			try:
+				result = MergeResult(fcode, future.result(), None)
+			except Exception as e:
+				self._logger.error(f'Merge of {fcode} failed: {e}')
+				result = MergeResult(fcode, None, e)
+			yield result
+
+	def _get_mapping_index(self, mapping_conf_key, field):
+		return MappingIndex.get_index(
+			self.s3,
+			self.data_conf['s3_bucket'],
+			self.data_conf[mapping_conf_key],
+			field,
+			ttl=self.mapping_ttl
+		)
+
 	def fd_to_fcode(self, fd_code):
 		"""
 
 		:param fd_code: fd code
 		:return: fcode
 		"""
-		s3_bucket = self.data_conf['s3_bucket']
-		s3_fdf_mapping = self.data_conf['s3_fdf_mapping']
-		fd_mapping = json.loads(S3Utils.read_s3_file(self.s3, s3_bucket, s3_fdf_mapping))
-		return fd_mapping['fcode'].get(fd_code, None)
+		return self._get_mapping_index('s3_fdf_mapping', 'fcode').get(fd_code)
+
+	def fd_to_fcode_many(self, fd_codes):
+		"""
+		bulk version of fd_to_fcode
+		:param fd_codes: iterable of fd codes
+		:return: dictionary fd code -> fcode (None if not found)
+		"""
+		return self._get_mapping_index('s3_fdf_mapping', 'fcode').get_many(fd_codes)
 
 	def f_to_fdcode(self, fcode):
-		s3_bucket = self.data_conf['s3_bucket']
-		s3_ffd_mapping = self.data_conf['s3_ffd_mapping']
+		return self._get_mapping_index('s3_ffd_mapping', 'video_content_ids').get(fcode)
 
-		fd_mapping = json.loads(S3Utils.read_s3_file(self.s3, s3_bucket, s3_ffd_mapping))
-		return fd_mapping['video_content_ids'].get(fcode, None)
+	def f_to_fdcode_many(self, fcodes):
+		"""
+		bulk version of f_to_fdcode
+		:param fcodes: iterable of fcodes
+		:return: dictionary fcode -> fd code (None if not found)
+		"""
+		return self._get_mapping_index('s3_ffd_mapping', 'video_content_ids').get_many(fcodes)
+
+	def idserie_to_fcodes(self, idserie):
+		"""
+		reverse lookup of the fcode/serie mapping
+		:param idserie: Mythematics series id
+		:return: list of the fcodes belonging to idserie
+		"""
+		return self._get_mapping_index('fcode_serie_mapping_path', 'idserie').reverse_get(idserie)
 
 	@staticmethod
 	def get_meta_info(default, values):
@@ -0,0 +1,158 @@
+import json
+import logging
+import sys
+import threading
+import time
+
+from easy.Instrumentation import Instrumentation
+from easy.Utils import S3Utils
+
+
+class MappingIndex:
+	"""
+	In-memory index of a json mapping file stored on S3, i.e. a file like
+		>>> {"fcode": {"FD0000000001": "F000000001", ...}}
+
+	The file is downloaded once per process (see `MappingIndex.get_index`) and,
+	once `ttl` seconds have passed, it is revalidated with a conditional GET on its
+	ETag, so an unchanged file is never downloaded twice.
+		>>> index = MappingIndex.get_index(s3, 'bucket', 'mapping/fd_f.json', 'fcode')
+		>>> index.get('FD0000000001')
+		>>> 'F000000001'
+		>>> index.get_many(['FD0000000001', 'FD0000000002'])
+		>>> {'FD0000000001': 'F000000001', 'FD0000000002': None}
+		>>> index.reverse_get('F000000001')
+		>>> ['FD0000000001']
+	"""
+	_registry = {}
+	_registry_lock = threading.Lock()
+
+	def __init__(self, s3, bucket, key, field, ttl=300):
+		"""
+		:param s3: s3 object
+		:param bucket: s3 bucket
+		:param key: s3 key of the mapping json
+		:param field: the field of the json holding the mapping
+		:param ttl: seconds after which the file is revalidated (None never revalidates)
+		"""
+		self.s3 = s3
+		self.bucket = bucket
+		self.key = key
+		self.field = field
+		self.ttl = ttl
+
+		self._forward = {}
+		self._reverse = None
+		self._etag = None
+		self._loaded_at = None
+		self._lock = threading.Lock()
+		self._logger = logging.getLogger(self.__class__.__name__)
+
+	@classmethod
+	def get_index(cls, s3, bucket, key, field, ttl=300):
+		"""
+		return the process-wide index of bucket/key/field, creating it at the first call.
+		The mapping is loaded once whatever the callers: the index is revalidated with the
+		smallest ttl requested so far and it reads with the s3 object of the latest caller
+		"""
+		index_key = (bucket, key, field)
+		with cls._registry_lock:
+			index = cls._registry.get(index_key)
+			if index is None:
+				index = cls(s3, bucket, key, field, ttl=ttl)
+				cls._registry[index_key] = index
+			else:
+				index.s3 = s3
+				if ttl is not None and (index.ttl is None or ttl < index.ttl):
+					index.ttl = ttl
+			return index
+
+	@classmethod
+	def clear_registry(cls):
+		with cls._registry_lock:
+			cls._registry = {}
+
+	def _is_expired(self):
+		if self._loaded_at is None:
+			return True
+		return self.ttl is not None and time.monotonic() - self._loaded_at > self.ttl
+
+	def refresh(self, force=False):
+		"""
+		(re)load the mapping if it is expired (or if force is True)
+		:param force: download the file even if it is not expired or modified
+		:return: True if a new version of the mapping has been loaded
+		"""
+		with self._lock:
+			if not force and not self._is_expired():
+				return False
+
+			js_string, etag = S3Utils.read_s3_file_if_changed(
+				self.s3, self.bucket, self.key, etag=None if force else self._etag
+			)
+			self._loaded_at = time.monotonic()
+			if js_string is None:
+				self._logger.debug(f'Mapping {self.bucket}/{self.key} not modified')
+				return False
+
+			Instrumentation.count('mapping_index.loads')
+			mapping = json.loads(js_string)[self.field]
+			# many codes map to the same value (e.g. fcode -> idserie): interning
+			# keeps a single copy of each distinct value in memory
+			self._forward = {
+				k: sys.intern(v) if isinstance(v, str) else v for k, v in mapping.items()
+			}
+			self._reverse = None
+			self._etag = etag
+			self._logger.info(f'Mapping {self.bucket}/{self.key} loaded: {len(self._forward)} codes')
+			return True
+
+	def _get_forward(self):
+		if self._is_expired():
+			self.refresh()
+		return self._forward
+
+	def _get_reverse(self):
+		forward = self._get_forward()
+		reverse = self._reverse
+		if reverse is None:
+			reverse = {}
+			for k, v in forward.items():
+				# list values (e.g. video_content_ids) are indexed by element,
+				# other unhashable values cannot be looked up and are skipped
+				for value in (v if isinstance(v, list) else [v]):
+					if isinstance(value, (list, dict)):
+						continue
+					reverse.setdefault(value, []).append(k)
+			self._reverse = reverse
+		return reverse
+
+	def get(self, code, default=None):
+		return self._get_forward().get(code, default)
+
+	def get_many(self, codes, default=None):
+		"""
+		bulk version of get
+		:param codes: iterable of codes
+		:param default: value returned for the codes not in mapping
+		:return: dictionary code -> mapped value
+		"""
+		forward = self._get_forward()
+		return {code: forward.get(code, default) for code in codes}
+
+	def reverse_get(self, value):
+		"""
+		:param value: a mapped value (or an element of a mapped list)
+		:return: the list of codes mapped to value (empty if none)
+		"""
+		return list(self._get_reverse().get(value, []))
+
+	def reverse_get_many(self, values):
+		reverse = self._get_reverse()
+		return {value: list(reverse.get(value, [])) for value in values}
+
+	def __contains__(self, code):
+		return code in self._get_forward()
+
+	def __len__(self):
+		return len(self._get_forward())
@@ -0,0 +1,178 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class SessionStats:
+	"""
+	thread-safe counters of the requests sent through the adapters of a SessionRegistry key
+	"""
+	def __init__(self):
+		self.requests = 0
+		self.retries = 0
+		self._lock = threading.Lock()
+
+	def count(self, requests=0, retries=0):
+		with self._lock:
+			self.requests += requests
+			self.retries += retries
+
+
+class CountingRetry(Retry):
+	"""
+	urllib3 Retry counting the retries in a SessionStats
+	"""
+	stats = None
+
+	def new(self, **kw):
+		retry = super().new(**kw)
+		retry.stats = self.stats
+		return retry
+
+	def increment(self, *args, **kwargs):
+		retry = super().increment(*args, **kwargs)
+		if self.stats is not None:
+			self.stats.count(retries=1)
+		return retry
+
+
+class SharedHTTPAdapter(HTTPAdapter):
+	"""
+	HTTPAdapter shared by the sessions of many threads: Session.close does not close
+	its connection pools, that are closed only by SessionRegistry.clear
+	"""
+	def __init__(self, stats, **kwargs):
+		self.stats = stats
+		super().__init__(**kwargs)
+
+	def send(self, request, **kwargs):
+		self.stats.count(requests=1)
+		return super().send(request, **kwargs)
+
+	def close(self):
+		pass
+
+	def close_pools(self):
+		super().close()
+
+	def connection_counts(self):
+		"""
+		:return: (opened connections, requests sent on an already opened connection)
+		"""
+		pools = self.poolmanager.pools
+		connections = 0
+		reused = 0
+		for pool_key in pools.keys():
+			pool = pools.get(pool_key)
+			if pool is None:
+				continue
+			connections += pool.num_connections
+			reused += max(0, pool.num_requests - pool.num_connections)
+		return connections, reused
+
+
+class SessionRegistry:
+	"""
+	Process-wide registry of pooled requests sessions.
+	There is a single HTTPAdapter (and so a single connection pool, kept alive across
+	calls) for each retry policy and base url, while every call returns a new Session
+	mounting that adapter: headers, auth and cookies are not shared between callers,
+	connections are.
+		>>> session = SessionRegistry.get_session(retries=5, pool_maxsize=50)
+		>>> session.get('https://example.com/api')
+		>>> SessionRegistry.stats()
+	"""
+	_adapters = {}
+	_lock = threading.Lock()
+
+	@classmethod
+	def get_session(
+			cls,
+			retries=3,
+			backoff_factor=0.3,
+			status_forcelist=(500, 502, 504),
+			base_url=None,
+			pool_connections=10,
+			pool_maxsize=10,
+			pool_block=False
+	):
+		"""
+		return a new session mounting the shared adapter of the retry policy and base url.
+		The pool arguments are used only when the adapter of the key is created.
+		:param retries: max retries (total, read and connect)
+		:param backoff_factor: backoff factor between retries
+		:param status_forcelist: status codes to retry
+		:param base_url: url prefix the adapter is mounted on (default every http/https url)
+		:param pool_connections: number of connection pools (one for each host)
+		:param pool_maxsize: max connections kept open for each host
+		:param pool_block: if True wait for a free connection instead of opening a new one
+		:return: a requests.Session
+		"""
+		key = (retries, backoff_factor, tuple(status_forcelist), base_url)
+		adapter = cls._get_adapter(key, pool_connections, pool_maxsize, pool_block)
+		session = requests.Session()
+		for prefix in ([base_url] if base_url else ['http://', 'https://']):
+			session.mount(prefix, adapter)
+		return session
+
+	@classmethod
+	def _get_adapter(cls, key, pool_connections, pool_maxsize, pool_block):
+		with cls._lock:
+			adapter = cls._adapters.get(key)
+			if adapter is None:
+				retries, backoff_factor, status_forcelist, _ = key
+				stats = SessionStats()
+				retry = CountingRetry(
+					total=retries,
+					read=retries,
+					connect=retries,
+					backoff_factor=backoff_factor,
+					status_forcelist=status_forcelist,
+				)
+				retry.stats = stats
+				adapter = SharedHTTPAdapter(
+					stats,
+					pool_connections=pool_connections,
+					pool_maxsize=pool_maxsize,
+					pool_block=pool_block,
+					max_retries=retry
+				)
+				cls._adapters[key] = adapter
+			return adapter
+
+	@classmethod
+	def stats(cls):
+		"""
+		:return: dict with the counters of requests, retries, opened and reused connections,
+			in total and for each (retries, backoff_factor, status_forcelist, base_url) key
+		"""
+		with cls._lock:
+			adapters = list(cls._adapters.items())
+
+		total = {'requests': 0, 'retries': 0, 'connections': 0, 'reused_connections': 0}
+		by_key = {}
+		for key, adapter in adapters:
+			connections, reused = adapter.connection_counts()
+			key_stats = {
+				'requests': adapter.stats.requests,
+				'retries': adapter.stats.retries,
+				'connections': connections,
+				'reused_connections': reused
+			}
+			by_key[key] = key_stats
+			for name, value in key_stats.items():
+				total[name] += value
+		return dict(total, sessions=by_key)
+
+	@classmethod
+	def clear(cls):
+		"""
+		close all the connection pools
+		"""
+		with cls._lock:
+			adapters = list(cls._adapters.values())
+			cls._adapters.clear()
+		for adapter in adapters:
+			adapter.close_pools()
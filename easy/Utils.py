@@ -1,20 +1,231 @@
-from botocore.exceptions import ClientError
 import json
+import gzip
+import io
 import hashlib
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 import re
 import datetime
-import validators
-import botocore
+import functools
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+from easy.Instrumentation import Instrumentation
+
+
+class PatternMatcher:
+	"""
+	Compiled version of Utils.isin: a value matches if any pattern matches at its
+	beginning (re.match), case-insensitively. Patterns without regex special
+	characters are checked with a set lookup and str.startswith, the others are
+	compiled once into a single alternation.
+	Use PatternMatcher.get to share the matcher of a pattern list:
+		>>> matcher = PatternMatcher.get(['genere', 'people-.*'])
+		>>> matcher.match('PEOPLE-attore')
+		>>> True
+		>>> matcher.filter(['genere', 'mood', 'people-regista'])
+		>>> ['genere', 'people-regista']
+	"""
+	_REGEX_CHARS = frozenset('.^$*+?{}[]\\|()')
+
+	def __init__(self, patterns):
+		# patterns are upper-cased as in Utils.isin (i.e. before compiling them)
+		patterns = [p.upper() for p in patterns]
+		literals = [p for p in patterns if not self._REGEX_CHARS.intersection(p)]
+		regexes = [p for p in patterns if self._REGEX_CHARS.intersection(p)]
+
+		self.patterns = tuple(patterns)
+		self._exact = frozenset(literals)
+		self._prefixes = tuple(literals)
+		self._regexes = []
+		if regexes:
+			try:
+				self._regexes = [re.compile('|'.join(f'(?:{r})' for r in regexes))]
+			except re.error:
+				# e.g. global inline flags not at the start of the alternation
+				self._regexes = [re.compile(r) for r in regexes]
+
+	@staticmethod
+	@functools.lru_cache(maxsize=256)
+	def _get(patterns):
+		return PatternMatcher(patterns)
+
+	@staticmethod
+	def get(patterns):
+		"""
+		return the (cached) matcher of patterns
+		:param patterns: iterable of patterns
+		:return: a PatternMatcher
+		"""
+		return PatternMatcher._get(tuple(patterns))
+
+	def match(self, value):
+		value = value.upper()
+		if value in self._exact or value.startswith(self._prefixes):
+			return True
+		return any(r.match(value) for r in self._regexes)
+
+	def filter(self, values):
+		"""
+		:param values: iterable of strings
+		:return: the list of values matching any pattern
+		"""
+		return [v for v in values if self.match(v)]
+
+	def exclude(self, values):
+		"""
+		:param values: iterable of strings
+		:return: the list of values not matching any pattern
+		"""
+		return [v for v in values if not self.match(v)]
+
+
+Instrumentation.register_cache('pattern_matcher', PatternMatcher._get.cache_info)
+
+
+class ValueNormalizer:
+	"""
+	Utils.normalize_value with a bounded LRU cache keyed by (value, to_bool), since
+	most values (genres, flags, channels, ...) repeat across documents.
+	Cheap prefilters skip the url and date checks when they cannot match:
+	a url needs a scheme (so a ':') and a '%Y-%m-%dT%H:%M:%SZ' date has a '-'
+	after the 4 digits of the year and ends with 'Z'.
+	Use ValueNormalizer.get for the shared instance used by Utils:
+		>>> normalizer = ValueNormalizer.get()
+		>>> normalizer.normalize_many(['  Si ', 'drama!'])
+		>>> [True, 'drama']
+		>>> normalizer.stats()
+		>>> {'hits': 0, 'misses': 2, 'size': 2, 'maxsize': 65536, 'hit_rate': 0.0}
+	"""
+	_shared = None
+
+	def __init__(self, cache_size=65536):
+		"""
+		:param cache_size: max number of normalized values kept in memory
+		"""
+		self.cache_size = cache_size
+		self._normalize = functools.lru_cache(maxsize=cache_size)(ValueNormalizer._normalize_uncached)
+
+	@staticmethod
+	def get():
+		"""
+		return the shared normalizer
+		"""
+		if ValueNormalizer._shared is None:
+			ValueNormalizer._shared = ValueNormalizer()
+			Instrumentation.register_cache('value_normalizer', ValueNormalizer._shared.stats)
+		return ValueNormalizer._shared
+
+	@staticmethod
+	def _maybe_date(string):
+		# strptime matches case-insensitively, so the final 'Z' can be lower case
+		return len(string) >= 15 and string[4] == '-' and string[-1] in 'Zz'
+
+	@staticmethod
+	def _normalize_uncached(string, to_bool):
+		if (':' in string and Utils.is_url(string)) or (ValueNormalizer._maybe_date(string) and Utils.is_date(string)):
+			return string
+		else:
+			return Utils.compact_string(string, to_bool)
+
+	def normalize(self, string, to_bool=True):
+		return self._normalize(string, to_bool)
+
+	def normalize_many(self, values, to_bool=True):
+		"""
+		normalize a list of values; values that are not strings are returned unchanged
+		:param values: list of values
+		:param to_bool: a bool, or a list of bools with one element for each value
+		:return: the list of normalized values
+		"""
+		normalize = self._normalize
+		if isinstance(to_bool, bool):
+			return [normalize(v, to_bool) if isinstance(v, str) else v for v in values]
+		return [normalize(v, b) if isinstance(v, str) else v for v, b in zip(values, to_bool)]
+
+	def stats(self):
+		"""
+		:return: a dictionary with hits, misses and hit_rate of the cache
+		"""
+		info = self._normalize.cache_info()
+		calls = info.hits + info.misses
+		return {
+			'hits': info.hits,
+			'misses': info.misses,
+			'size': info.currsize,
+			'maxsize': info.maxsize,
+			'hit_rate': info.hits / calls if calls else 0.0
+		}
+
+	def cache_clear(self):
+		self._normalize.cache_clear()
+
+
+class TTLCache:
+	"""
+	Bounded thread-safe cache: entries expire ttl seconds after being set and the
+	least recently used entry is evicted when maxsize is reached.
+		>>> cache = TTLCache(maxsize=1000, ttl=60)
+		>>> cache.set(('index', 'id'), doc)
+		>>> cache.get(('index', 'id'))
+	"""
+	def __init__(self, maxsize=1024, ttl=60):
+		self.maxsize = maxsize
+		self.ttl = ttl
+		self.hits = 0
+		self.misses = 0
+		self._data = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key, default=None):
+		with self._lock:
+			item = self._data.get(key)
+			if item is not None:
+				expire_time, value = item
+				if expire_time > time.monotonic():
+					self._data.move_to_end(key)
+					self.hits += 1
+					return value
+				del self._data[key]
+			self.misses += 1
+			return default
+
+	def set(self, key, value):
+		with self._lock:
+			self._data[key] = (time.monotonic() + self.ttl, value)
+			self._data.move_to_end(key)
+			while len(self._data) > self.maxsize:
+				self._data.popitem(last=False)
+
+	def delete(self, key):
+		with self._lock:
+			self._data.pop(key, None)
+
+	def clear(self):
+		with self._lock:
+			self._data.clear()
+
+	def stats(self):
+		"""
+		:return: a dictionary with hits, misses and hit_rate of the cache
+		"""
+		calls = self.hits + self.misses
+		return {
+			'hits': self.hits,
+			'misses': self.misses,
+			'size': len(self._data),
+			'maxsize': self.maxsize,
+			'hit_rate': self.hits / calls if calls else 0.0
+		}
+
+	def __len__(self):
+		return len(self._data)
 
 
 class Utils:
 	@staticmethod
 	def isin(value, array):
-		array = [a.upper() for a in array]
-		return any([bool(re.match(a, value.upper())) for a in array])
+		return PatternMatcher.get(array).match(value)
 
 	@staticmethod
 	def ordered_obj(obj):
@@ -26,15 +237,23 @@ class Utils:
 			return obj
 
 	@staticmethod
-	def get_ordered_json(js, s3=None, drop=None):
+	def load_json(js, s3=None):
+		"""
+		return js as a dictionary
+		:param js: a dictionary or a path (local or s3://bucket/key) of a json
+		:param s3: s3 object (needed for s3 paths)
+		:return: a dictionary
+		"""
 		if type(js) == str:
 			if js.startswith('s3'):
+				from botocore.exceptions import ClientError
+
 				s3_path = js.replace('s3://', '').split('/')
 				try:
 					s3_obj = s3.Object(s3_path[0], '/'.join(s3_path[1:])).get()
 				except ClientError as e:
 					raise FileNotFoundError(e)
-				js_string = s3_obj['Body'].read().decode('utf-8')
+				js_string = S3Utils.decode_body(s3_obj['Body'].read(), s3_obj.get('ContentEncoding'))
 				js = json.loads(js_string)
 			else:
 				with open(js) as json_file:
@@ -43,20 +262,157 @@ class Utils:
 			pass
 		else:
 			raise AttributeError(f'No valid js parameter. Parameter type: {type(js)} ')
+		return js
+
+	@staticmethod
+	def get_ordered_json(js, s3=None, drop=None):
+		js = Utils.load_json(js, s3)
 
 		if drop is not None:
 			js = {k: v for k, v in js.items() if k not in drop}
 
 		return Utils.ordered_obj(js)
 
+	@staticmethod
+	def _canonical_scalar(obj):
+		# every value is written with a type tag and, if needed, its length so that
+		# the concatenation of canonical values is unambiguous
+		if isinstance(obj, str):
+			b = obj.encode('utf-8')
+			return b's%d:%s' % (len(b), b)
+		elif obj is None:
+			return b'n'
+		elif obj is True:
+			return b't'
+		elif obj is False:
+			return b'f'
+		elif isinstance(obj, int):
+			return b'i%d;' % obj
+		elif isinstance(obj, float):
+			return b'r%s;' % repr(obj).encode('ascii')
+		else:
+			raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+	@staticmethod
+	def _update_canonical(hasher, obj, algorithm):
+		if isinstance(obj, dict):
+			items = sorted(
+				(k if isinstance(k, str) else json.dumps(k), v) for k, v in obj.items()
+			)
+			hasher.update(b'd%d:' % len(items))
+			for k, v in items:
+				hasher.update(Utils._canonical_scalar(k))
+				Utils._update_canonical(hasher, v, algorithm)
+		elif isinstance(obj, (list, tuple)):
+			# lists are unordered: the canonical items are sorted before being hashed,
+			# nested containers are replaced by their digest
+			items = []
+			for x in obj:
+				if type(x) is str:
+					b = x.encode('utf-8')
+					items.append(b's%d:%s' % (len(b), b))
+				elif isinstance(x, (dict, list, tuple)):
+					item_hasher = hashlib.new(algorithm)
+					Utils._update_canonical(item_hasher, x, algorithm)
+					items.append(b'h' + item_hasher.digest())
+				else:
+					items.append(Utils._canonical_scalar(x))
+			items.sort()
+			hasher.update(b'l%d:' % len(items))
+			hasher.update(b''.join(items))
+		else:
+			hasher.update(Utils._canonical_scalar(obj))
+
+	@staticmethod
+	def canonical_digest(dct, drop=None, algorithm='sha256'):
+		"""
+		Stable digest of a json-like dictionary: the canonical form of dct is streamed
+		into the hash without building intermediate sorted copies (as ordered_obj does).
+		Dictionary keys are sorted and lists are treated as unordered, so
+			>>> Utils.canonical_digest({'a': [2, 'x', 1], 'b': 0}) == Utils.canonical_digest({'b': 0, 'a': [1, 2, 'x']})
+			>>> True
+		Unlike ordered_obj, lists with mixed types are supported and True/1, 1/1.0 are
+		considered different values.
+		:param dct: a dictionary
+		:param drop: keys not considered
+		:param algorithm: a hashlib algorithm
+		:return: the hex digest
+		"""
+		if drop is not None:
+			dct = {k: v for k, v in dct.items() if k not in drop}
+
+		hasher = hashlib.new(algorithm)
+		Utils._update_canonical(hasher, dct, algorithm)
+		return hasher.hexdigest()
+
+	@staticmethod
+	def json_digest(js, s3=None, drop=None):
+		"""
+		canonical_digest of a json
+		:param js: a dictionary or a path (local or s3) of a json
+		:param s3: s3 object (needed for s3 paths)
+		:param drop: keys not considered
+		:return: the hex digest
+		"""
+		return Utils.canonical_digest(Utils.load_json(js, s3), drop=drop)
+
+	@staticmethod
+	def map_unordered(func, items, max_workers=16):
+		"""
+		call func(item) for every item on a pool of max_workers threads, with at most
+		2*max_workers items in flight (so items can be a generator of any length), and
+		yield (item, future) as soon as each call completes (NOT in the order of items):
+		future.result() returns the result of the call or raises its error
+			>>> for fcode, future in Utils.map_unordered(merge, fcodes, max_workers=8):
+			>>> 	document = future.result()
+		:param func: function of one item
+		:param items: iterable of items
+		:param max_workers: size of the thread pool
+		:return: generator of (item, future) tuples
+		"""
+		from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+		items = iter(items)
+		with ThreadPoolExecutor(max_workers=max_workers) as executor:
+			pending = {executor.submit(func, item): item for item in itertools.islice(items, 2 * max_workers)}
+			while pending:
+				done, _ = wait(pending, return_when=FIRST_COMPLETED)
+				for future in done:
+					item = pending.pop(future)
+					for next_item in itertools.islice(items, 1):
+						pending[executor.submit(func, next_item)] = next_item
+					yield item, future
+
 	@staticmethod
 	def requests_retry_session(
 			retries=3,
 			backoff_factor=0.3,
 			status_forcelist=(500, 502, 504),
 			session=None,
+			pool_connections=10,
+			pool_maxsize=10,
 	):
-		session = session or requests.Session()
+		"""
+		return a session retrying the failed requests.
+		Without session, a new session mounting the pooled adapter of the SessionRegistry
+		is returned, so the connections are reused across calls; otherwise a new
+		adapter with the retry policy is mounted on session.
+		:param pool_connections: number of connection pools (one for each host)
+		:param pool_maxsize: max connections kept open for each host
+		"""
+		from requests.adapters import HTTPAdapter
+		from urllib3.util.retry import Retry
+		from easy.SessionRegistry import SessionRegistry
+
+		if session is None:
+			return SessionRegistry.get_session(
+				retries=retries,
+				backoff_factor=backoff_factor,
+				status_forcelist=status_forcelist,
+				pool_connections=pool_connections,
+				pool_maxsize=pool_maxsize
+			)
+
 		retry = Retry(
 			total=retries,
 			read=retries,
@@ -64,7 +420,7 @@ class Utils:
 			backoff_factor=backoff_factor,
 			status_forcelist=status_forcelist,
 		)
-		adapter = HTTPAdapter(max_retries=retry)
+		adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_connections, pool_maxsize=pool_maxsize)
 		session.mount('http://', adapter)
 		session.mount('https://', adapter)
 		return session
@@ -105,107 +461,688 @@ class Utils:
 
 	@staticmethod
 	def is_url(string):
+		import validators
 		return validators.url(string)
 
 	@staticmethod
 	def normalize_value(string, to_bool=True):
-		if Utils.is_url(string) or Utils.is_date(string):
-			return string
-		else:
-			return Utils.compact_string(string, to_bool)
+		return ValueNormalizer.get().normalize(string, to_bool)
 
 	@staticmethod
+	@Instrumentation.timed('normalize_json')
 	def normalize_json(dct, key_blacklist=None):
+		return Utils._normalize_json(dct, key_blacklist)
+
+	@staticmethod
+	def _normalize_json(dct, key_blacklist=None):
 		dct = dct.copy()
 
 		if key_blacklist is None:
 			key_blacklist = []
 
-		dct_blacklisted = {k: v for k, v in dct.items() if not Utils.isin(k, key_blacklist)}
-
-		for k, value in dct_blacklisted.items():
+		normalizer = ValueNormalizer.get()
+		for k in PatternMatcher.get(key_blacklist).exclude(dct):
+			value = dct[k]
 			if isinstance(value, str):
-				dct[k] = Utils.normalize_value(value)
+				dct[k] = normalizer.normalize(value)
 			elif isinstance(value, list):
-				dct[k] = [Utils.normalize_value(v, to_bool=False) if isinstance(v, str) else v for v in value]
+				dct[k] = normalizer.normalize_many(value, to_bool=False)
 			elif isinstance(value, dict):
-				dct[k] = Utils.normalize_json(value)
+				dct[k] = Utils._normalize_json(value)
 		return dct
 
 	@staticmethod
+	@Instrumentation.timed('normalize_clear_metas')
 	def normalize_clear_metas_list(clear_metas, sep='='):
-		result = []
-		for key_value in clear_metas:
-			key, value = MetadataUtils.split_meta_value(key_value, sep)
-			b = False if key == 'keyword' else True
-			normalized_value = Utils.normalize_value(value, to_bool=b)
+		keys_values = [MetadataUtils.split_meta_value(key_value, sep) for key_value in clear_metas]
+		normalized_values = ValueNormalizer.get().normalize_many(
+			[value for _, value in keys_values],
+			to_bool=[key != 'keyword' for key, _ in keys_values]
+		)
+		return [f'{key}={value}' for (key, _), value in zip(keys_values, normalized_values)]
 
-			result.append(f'{key}={normalized_value}')
-		return result
+
+	@staticmethod
+	def normalize_records(records, key_blacklist=None, clear_metas_key='clear_metas', sep='='):
+		"""
+		generator that normalizes a stream of json records with normalize_json; the
+		clear_metas_key list (if present) is normalized with normalize_clear_metas_list
+		:param records: iterable of dictionaries
+		:param key_blacklist: keys not normalized
+		:param clear_metas_key: key of the clear metas list (None to disable)
+		:param sep:
+		:return: generator of normalized dictionaries
+		"""
+		key_blacklist = [] if key_blacklist is None else list(key_blacklist)
+		if clear_metas_key is not None:
+			key_blacklist.append(f'^{re.escape(clear_metas_key)}$')
+
+		for record in records:
+			record = Utils.normalize_json(record, key_blacklist)
+			if clear_metas_key is not None and isinstance(record.get(clear_metas_key), list):
+				record[clear_metas_key] = Utils.normalize_clear_metas_list(record[clear_metas_key], sep=sep)
+			yield record
+
+	@staticmethod
+	def normalize_json_lines(source, target, s3=None, key_blacklist=None, clear_metas_key='clear_metas', sep='=', **write_kwargs):
+		"""
+		Stream a JSON Lines file (local or s3://, gzipped if it ends with .gz)
+		record by record, normalize it with normalize_records and write the result
+		to target (s3 targets are written with a multipart upload): memory usage does
+		not depend on the size of the file.
+			>>> Utils.normalize_json_lines('s3://bucket/dump.jsonl.gz', 's3://bucket/normalized.jsonl.gz', s3)
+		:param source: path of the JSON Lines file to read
+		:param target: path of the JSON Lines file to write
+		:param s3: s3 object (needed for s3 paths)
+		:param key_blacklist:
+		:param clear_metas_key:
+		:param sep:
+		:param write_kwargs: other arguments of S3Utils.write_json_lines
+		:return: number of records written
+		"""
+		records = S3Utils.iter_json_lines(source, s3=s3)
+		normalized = Utils.normalize_records(records, key_blacklist, clear_metas_key=clear_metas_key, sep=sep)
+		return S3Utils.write_json_lines(normalized, target, s3=s3, **write_kwargs)
 
 
 class S3Utils:
+	# user metadata (x-amz-meta-content-digest) where write_json_if_toupdate stores Utils.json_digest
+	DIGEST_METADATA_KEY = 'content-digest'
+	# user metadata with the (json list of the) keys dropped to compute the digest
+	DIGEST_DROP_METADATA_KEY = 'content-digest-drop'
+	# error codes of a HEAD of a missing key made without the s3:ListBucket permission
+	FORBIDDEN_CODES = ['403', 'forbidden', 'accessdenied']
+	COMPRESSIONS = ['gzip', 'zstd']
+	# payloads of at least MULTIPART_THRESHOLD bytes are written with a multipart upload
+	MULTIPART_THRESHOLD = 64 * 1024 * 1024
+
+	@staticmethod
+	def compress(data, compression, level=None):
+		"""
+		:param data: bytes
+		:param compression: 'gzip' or 'zstd' (needs the zstandard package)
+		:param level: compression level (default that of the algorithm)
+		:return: the compressed bytes
+		"""
+		if compression == 'gzip':
+			# mtime=0: the same content is always compressed to the same bytes (and ETag)
+			return gzip.compress(data, compresslevel=9 if level is None else level, mtime=0)
+		elif compression == 'zstd':
+			return S3Utils._zstandard().ZstdCompressor(level=3 if level is None else level).compress(data)
+		raise ValueError(f"The only compression values are: {','.join(S3Utils.COMPRESSIONS)}")
+
+	@staticmethod
+	def decompress(data, content_encoding):
+		"""
+		:param data: bytes
+		:param content_encoding: Content-Encoding of data (None or identity: not compressed)
+		:return: the decompressed bytes
+		"""
+		if not content_encoding or content_encoding == 'identity':
+			return data
+		elif content_encoding == 'gzip':
+			return gzip.decompress(data)
+		elif content_encoding == 'zstd':
+			# decompressobj also reads frames written in streaming mode (without content size)
+			return S3Utils._zstandard().ZstdDecompressor().decompressobj().decompress(data)
+		raise ValueError(f'Content-Encoding {content_encoding} not supported')
+
+	@staticmethod
+	def decode_body(data, content_encoding=None, encoding='utf-8'):
+		"""
+		decompress (according to its Content-Encoding) and decode the body of an s3 object
+		"""
+		return S3Utils.decompress(data, content_encoding).decode(encoding)
+
 	@staticmethod
-	def write_s3_file(s3, bucket, key, str_file):
+	def _zstandard():
+		try:
+			import zstandard
+		except ImportError:
+			raise ValueError('zstd compression needs the zstandard package: pip install mds-easy-libs[zstd]')
+		return zstandard
+
+	@staticmethod
+	@Instrumentation.timed('s3.put')
+	def write_s3_file(
+			s3,
+			bucket,
+			key,
+			str_file,
+			metadata=None,
+			compression=None,
+			compression_level=None,
+			multipart_threshold=None,
+			part_size=8 * 1024 * 1024,
+			max_concurrency=10,
+			encoding='utf-8'
+	):
 		"""
+		write str_file to s3, optionally compressed: the Content-Encoding of the object
+		is set, so read_s3_file (and load_json, AsyncS3Utils, ...) decompress it transparently.
+		Payloads of at least multipart_threshold bytes (after compression) are uploaded
+		with a managed multipart transfer of parts of part_size bytes, max_concurrency
+		at a time.
+			>>> S3Utils.write_s3_file(s3, 'bucket', 'catalog.json', js_string, compression='gzip')
 		:param s3:
 		:param bucket:
 		:param key:
-		:param str_file:
-		:return:
+		:param str_file: str or bytes
+		:param metadata: user metadata of the object (optional)
+		:param compression: None, 'gzip' or 'zstd' (needs the zstandard package)
+		:param compression_level: compression level (default that of the algorithm)
+		:param multipart_threshold: min size of a multipart upload (default MULTIPART_THRESHOLD)
+		:param part_size: size of the parts of a multipart upload
+		:param max_concurrency: parts uploaded in parallel
+		:param encoding: encoding of str_file, if it is a str
+		:return: the put response (None for multipart uploads)
 		"""
+		put_args = {}
+		if metadata:
+			put_args['Metadata'] = metadata
+		# sizes are measured in bytes: a str is encoded first
+		if isinstance(str_file, str):
+			str_file = str_file.encode(encoding)
+		if compression is not None:
+			str_file = S3Utils.compress(str_file, compression, compression_level)
+			put_args['ContentEncoding'] = compression
+
+		Instrumentation.count('s3.put_bytes', len(str_file))
 		w_obj = s3.Object(bucket, key)
-		return w_obj.put(Body=str_file)
+		multipart_threshold = S3Utils.MULTIPART_THRESHOLD if multipart_threshold is None else multipart_threshold
+		if len(str_file) < multipart_threshold:
+			return w_obj.put(Body=str_file, **put_args)
+
+		from boto3.s3.transfer import TransferConfig
+
+		Instrumentation.count('s3.multipart_uploads')
+		w_obj.upload_fileobj(
+			io.BytesIO(str_file),
+			ExtraArgs=put_args or None,
+			Config=TransferConfig(
+				multipart_threshold=multipart_threshold,
+				multipart_chunksize=part_size,
+				max_concurrency=max_concurrency
+			)
+		)
+		return None
 
 	@staticmethod
+	@Instrumentation.timed('s3.head')
+	def head_s3_file(s3, bucket, key):
+		"""
+		return the HEAD response of an s3 object (ContentLength, ETag, Metadata, ...)
+		without downloading it
+		:param s3: s3 object
+		:param bucket: s3 bucket
+		:param key: s3 key
+		:return: the head_object response
+		"""
+		from botocore.exceptions import ClientError
+
+		try:
+			return s3.meta.client.head_object(Bucket=bucket, Key=key)
+		except ClientError as e:
+			if e.response['Error']['Code'].lower() in ['404', 'notfound', 'nosuchbucket', 'nosuchkey']:
+				Instrumentation.count('s3.head_not_found')
+				raise FileNotFoundError(f'File {bucket}/{key} not found: {e}')
+			else:
+				raise e
+
+	@staticmethod
+	@Instrumentation.timed('s3.get')
 	def read_s3_file(s3, bucket, key, encoding='utf-8'):
 		"""
-		return a json from s3 as a dictionary
+		return a json from s3 as a dictionary; objects written with a Content-Encoding
+		(see write_s3_file compression) are decompressed
 		:param s3: s3 object
 		:param bucket: s3 bucket
 		:param key: s3 key (with the specified json)
 		:param encoding: how to decode byte read
 		:return: a dictionary created from the json
 		"""
+		from botocore.exceptions import ClientError
+
 		try:
 			s3_obj = s3.Object(bucket, key).get()
-			js_string = s3_obj['Body'].read().decode(encoding)
+			js_bytes = s3_obj['Body'].read()
+			Instrumentation.count('s3.get_bytes', len(js_bytes))
+			js_string = S3Utils.decode_body(js_bytes, s3_obj.get('ContentEncoding'), encoding)
 			return js_string
-		except botocore.exceptions.ClientError as e:
+		except ClientError as e:
 			if e.response['Error']['Code'].lower() in ['nosuchbucket', 'nosuchkey']:
+				Instrumentation.count('s3.get_not_found')
 				raise FileNotFoundError(f'File {bucket}/{key} not found: {e}')
 			else:
 				raise e
 
 	@staticmethod
-	def json_already_exists(s3, json_result, s3_bucket, s3_key, drop=None):
-		current_ordered_js = Utils.get_ordered_json(json_result, drop=drop)
+	@Instrumentation.timed('s3.get_if_changed')
+	def read_s3_file_if_changed(s3, bucket, key, etag=None, encoding='utf-8'):
+		"""
+		conditional version of read_s3_file: the object body is downloaded only
+		if its ETag differs from the given one
+		:param s3: s3 object
+		:param bucket: s3 bucket
+		:param key: s3 key
+		:param etag: ETag of the copy already held by the caller (None to always download)
+		:param encoding: how to decode byte read
+		:return: a tuple (string, etag); string is None if the object was not modified
+		"""
+		from botocore.exceptions import ClientError
 
+		get_args = {} if etag is None else {'IfNoneMatch': etag}
 		try:
-			last_ordered_js = Utils.get_ordered_json(
-				f's3://{s3_bucket}/{s3_key}',
-				s3,
-				drop=drop
-			)
-			return current_ordered_js == last_ordered_js
+			s3_obj = s3.Object(bucket, key).get(**get_args)
+		except ClientError as e:
+			error_code = e.response['Error']['Code'].lower()
+			if error_code in ['304', 'notmodified']:
+				Instrumentation.count('s3.get_not_modified')
+				return None, etag
+			elif error_code in ['nosuchbucket', 'nosuchkey']:
+				Instrumentation.count('s3.get_not_found')
+				raise FileNotFoundError(f'File {bucket}/{key} not found: {e}')
+			else:
+				raise e
+		js_bytes = s3_obj['Body'].read()
+		Instrumentation.count('s3.get_bytes', len(js_bytes))
+		return S3Utils.decode_body(js_bytes, s3_obj.get('ContentEncoding'), encoding), s3_obj.get('ETag')
+
+	@staticmethod
+	def split_s3_path(s3_path):
+		"""
+			>>> S3Utils.split_s3_path('s3://bucket/path/file.json')
+			>>> ('bucket', 'path/file.json')
+		"""
+		s3_path = s3_path.replace('s3://', '').split('/')
+		return s3_path[0], '/'.join(s3_path[1:])
+
+	@staticmethod
+	def _is_gzip(path, compression):
+		return compression == 'gzip' or (compression is None and path.endswith('.gz'))
+
+	@staticmethod
+	def iter_json_lines(source, s3=None, compression=None, encoding='utf-8', chunk_size=1024 * 1024):
+		"""
+		generator of the records of a JSON Lines file, read as a stream
+		:param source: local path or s3://bucket/key
+		:param s3: s3 object (needed for s3 paths)
+		:param compression: 'gzip' or None (gzip if source ends with .gz); s3 objects
+			are also decompressed according to their Content-Encoding
+		:param encoding:
+		:param chunk_size: size of the chunks read from s3
+		:return: generator of dictionaries
+		"""
+		if source.startswith('s3://'):
+			from botocore.exceptions import ClientError
+
+			bucket, key = S3Utils.split_s3_path(source)
+			try:
+				s3_obj = s3.Object(bucket, key).get()
+			except ClientError as e:
+				if e.response['Error']['Code'].lower() in ['nosuchbucket', 'nosuchkey']:
+					raise FileNotFoundError(f'File {bucket}/{key} not found: {e}')
+				else:
+					raise e
+
+			body = s3_obj['Body']
+			content_encoding = s3_obj.get('ContentEncoding')
+			try:
+				if S3Utils._is_gzip(source, compression) or content_encoding == 'gzip':
+					lines = io.TextIOWrapper(gzip.GzipFile(fileobj=body), encoding=encoding)
+				elif content_encoding == 'zstd':
+					lines = io.TextIOWrapper(S3Utils._zstandard().ZstdDecompressor().stream_reader(body), encoding=encoding)
+				else:
+					lines = (line.decode(encoding) for line in body.iter_lines(chunk_size=chunk_size))
+				for line in lines:
+					if line.strip():
+						yield json.loads(line)
+			finally:
+				body.close()
+		else:
+			opener = gzip.open if S3Utils._is_gzip(source, compression) else open
+			with opener(source, 'rt', encoding=encoding) as f:
+				for line in f:
+					if line.strip():
+						yield json.loads(line)
+
+	@staticmethod
+	def write_json_lines(records, target, s3=None, compression=None, encoding='utf-8', part_size=8 * 1024 * 1024):
+		"""
+		write a stream of records as a JSON Lines file; s3 targets are written with a
+		multipart upload (see S3MultipartWriter) so only one part is kept in memory
+		:param records: iterable of dictionaries
+		:param target: local path or s3://bucket/key
+		:param s3: s3 object (needed for s3 paths)
+		:param compression: 'gzip' or None (gzip if target ends with .gz)
+		:param encoding:
+		:param part_size: size of the parts of the multipart upload
+		:return: number of records written
+		"""
+		n_records = 0
+		if target.startswith('s3://'):
+			bucket, key = S3Utils.split_s3_path(target)
+			with S3MultipartWriter(s3, bucket, key, part_size=part_size) as writer:
+				out = gzip.GzipFile(fileobj=writer, mode='wb', mtime=0) if S3Utils._is_gzip(target, compression) else writer
+				for record in records:
+					out.write((json.dumps(record, ensure_ascii=False) + '\n').encode(encoding))
+					n_records += 1
+				if out is not writer:
+					out.close()
+		else:
+			opener = gzip.open if S3Utils._is_gzip(target, compression) else open
+			with opener(target, 'wt', encoding=encoding) as f:
+				for record in records:
+					f.write(json.dumps(record, ensure_ascii=False) + '\n')
+					n_records += 1
+		return n_records
+
+	@staticmethod
+	def _drop_metadata(drop):
+		return json.dumps(sorted(drop or []), separators=(',', ':'))
+
+	@staticmethod
+	def digest_metadata(digest, drop=None):
+		"""
+		user metadata recording the digest of a json and the keys dropped to compute it
+		"""
+		return {
+			S3Utils.DIGEST_METADATA_KEY: digest,
+			S3Utils.DIGEST_DROP_METADATA_KEY: S3Utils._drop_metadata(drop)
+		}
+
+	@staticmethod
+	def stored_digest(head, drop=None):
+		"""
+		:param head: head_object response
+		:param drop: keys not considered in comparison
+		:return: the digest in the metadata of the object, None if it is missing or it
+			has been computed dropping other keys (so it is not comparable)
+		"""
+		metadata = head.get('Metadata', {})
+		if metadata.get(S3Utils.DIGEST_DROP_METADATA_KEY) != S3Utils._drop_metadata(drop):
+			return None
+		return metadata.get(S3Utils.DIGEST_METADATA_KEY)
+
+	@staticmethod
+	def json_already_exists(s3, json_result, s3_bucket, s3_key, drop=None, digest=None):
+		"""
+		check if the json in s3_bucket/s3_key is equal to json_result (apart from the keys in drop).
+		If the object has been written by write_json_if_toupdate with the same drop, its
+		digest is in the object metadata and only a HEAD request is made; otherwise the
+		object is downloaded and its digest is computed. A forbidden HEAD (a missing
+		key read without s3:ListBucket) means not existing, as with a failed GET.
+		:param s3:
+		:param json_result: the json to compare
+		:param s3_bucket:
+		:param s3_key:
+		:param drop: keys not considered in comparison
+		:param digest: Utils.json_digest(json_result, drop), if already computed
+		:return: True if the json already exists
+		"""
+		from botocore.exceptions import ClientError
+
+		try:
+			head = S3Utils.head_s3_file(s3, s3_bucket, s3_key)
 		except FileNotFoundError:
 			return False
+		except ClientError as e:
+			if e.response['Error']['Code'].lower() in S3Utils.FORBIDDEN_CODES:
+				Instrumentation.count('s3.head_forbidden')
+				return False
+			raise e
+
+		digest = Utils.json_digest(json_result, drop=drop) if digest is None else digest
+		last_digest = S3Utils.stored_digest(head, drop)
+		if last_digest is None:
+			Instrumentation.count('s3.digest_missing')
+			try:
+				last_digest = Utils.json_digest(f's3://{s3_bucket}/{s3_key}', s3, drop=drop)
+			except FileNotFoundError:
+				return False
+
+		return digest == last_digest
 
 	@staticmethod
-	def write_json_if_toupdate(s3, json_result, s3_bucket, s3_key, drop=None, write_anyway=False):
-		if not S3Utils.json_already_exists(
+	def write_json_if_toupdate(s3, json_result, s3_bucket, s3_key, drop=None, write_anyway=False, **write_kwargs):
+		"""
+		write json_result unless an equal json is already in s3_bucket/s3_key
+		:param write_kwargs: other arguments of write_s3_file (e.g. compression='gzip')
+		:return: True if the json has been written
+		"""
+		digest = Utils.json_digest(json_result, drop=drop)
+		if write_anyway or not S3Utils.json_already_exists(
 				s3,
 				json_result,
 				s3_bucket,
 				s3_key,
-				drop=drop
-		) or write_anyway:
-			S3Utils.write_s3_file(s3, s3_bucket	, s3_key, json.dumps(json_result, ensure_ascii=False))
+				drop=drop,
+				digest=digest
+		):
+			S3Utils.write_s3_file(
+				s3,
+				s3_bucket,
+				s3_key,
+				json.dumps(json_result, ensure_ascii=False),
+				metadata=S3Utils.digest_metadata(digest, drop),
+				**write_kwargs
+			)
 			return True
 		return False
 
+	@staticmethod
+	@Instrumentation.timed('s3.sync')
+	def sync_json_documents(
+			s3,
+			bucket,
+			prefix,
+			documents,
+			delete=False,
+			compression=None,
+			max_workers=16,
+			dry_run=False
+	):
+		"""
+		Bulk version of write_json_if_toupdate: publish a whole set of jsons under prefix
+		writing only the new or changed ones.
+		The prefix is listed once (ListObjectsV2) and the ETag of each object is compared
+		with the md5 of the payload that would be written (json.dumps, optionally
+		compressed): no object is downloaded. Objects with a multipart ETag (md5-N) are
+		compared through the digest metadata of a HEAD request.
+		Uploads (with the digest metadata, as write_json_if_toupdate) run on a pool of
+		max_workers threads.
+			>>> report = S3Utils.sync_json_documents(s3, 'bucket', 'merged/', {'F1.json': doc_1, 'F2.json': doc_2})
+			>>> report['updated'], report['failed']
+			>>> (['F2.json'], {})
+		:param s3: s3 object
+		:param bucket: s3 bucket
+		:param prefix: s3 prefix, a '/' is appended if missing (so 'merged' never matches
+			'merged_old/'); each document is written in prefix + key
+		:param documents: dict key -> json
+		:param delete: delete the objects under prefix whose key is not in documents
+		:param compression: None, 'gzip' or 'zstd' (see write_s3_file)
+		:param max_workers: parallel uploads
+		:param dry_run: only compute the report, without writing or deleting
+		:return: dict with the lists of keys (in completion order) 'created', 'updated',
+			'unchanged', 'deleted' and 'failed' (dict key -> error)
+		"""
+		if prefix and not prefix.endswith('/'):
+			prefix += '/'
+
+		client = s3.meta.client
+		etags = {}
+		for page in client.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+			for obj in page.get('Contents', []):
+				if obj['Key'].startswith(prefix):
+					etags[obj['Key'][len(prefix):]] = obj['ETag'].strip('"')
+
+		report = {'created': [], 'updated': [], 'unchanged': [], 'deleted': [], 'failed': {}}
+
+		def sync_one(key, js):
+			payload = json.dumps(js, ensure_ascii=False).encode('utf-8')
+			if compression is not None:
+				payload = S3Utils.compress(payload, compression)
+
+			etag = etags.get(key)
+			digest = None
+			if etag is not None:
+				if '-' not in etag:
+					if hashlib.md5(payload).hexdigest() == etag:
+						return 'unchanged'
+				else:
+					digest = Utils.json_digest(js)
+					head = client.head_object(Bucket=bucket, Key=prefix + key)
+					if S3Utils.stored_digest(head) == digest:
+						return 'unchanged'
+
+			if not dry_run:
+				put_args = dict(
+					Bucket=bucket,
+					Key=prefix + key,
+					Body=payload,
+					Metadata=S3Utils.digest_metadata(digest or Utils.json_digest(js))
+				)
+				if compression is not None:
+					put_args['ContentEncoding'] = compression
+				client.put_object(**put_args)
+				Instrumentation.count('s3.put_bytes', len(payload))
+			return 'created' if etag is None else 'updated'
+
+		def sync_item(item):
+			return sync_one(*item)
+
+		for (key, _), future in Utils.map_unordered(sync_item, documents.items(), max_workers):
+			try:
+				report[future.result()].append(key)
+			except Exception as e:
+				report['failed'][key] = e
+
+		if delete:
+			to_delete = [key for key in etags if key not in documents]
+			for i in range(0, len(to_delete), 1000):
+				chunk = to_delete[i:i + 1000]
+				if dry_run:
+					report['deleted'].extend(chunk)
+					continue
+				response = client.delete_objects(
+					Bucket=bucket,
+					Delete={'Objects': [{'Key': prefix + key} for key in chunk], 'Quiet': True}
+				)
+				errors = {error['Key'][len(prefix):]: error.get('Message') for error in response.get('Errors', [])}
+				report['failed'].update(errors)
+				report['deleted'].extend(key for key in chunk if key not in errors)
+
+		return report
+
+
+class S3MultipartWriter(io.RawIOBase):
+	"""
+	Writable file-like object that uploads to s3 with a multipart upload: data is
+	buffered and sent in parts of part_size bytes (the last one can be smaller).
+	If less than part_size bytes are written a single put is made instead.
+	The upload is completed on close and aborted if the with block raises.
+		>>> with S3MultipartWriter(s3, 'bucket', 'path/file.jsonl') as writer:
+		>>> 	writer.write(b'{"a": 1}\\n')
+	"""
+	MIN_PART_SIZE = 5 * 1024 * 1024
+
+	def __init__(self, s3, bucket, key, part_size=8 * 1024 * 1024, **put_kwargs):
+		"""
+		:param s3: s3 object
+		:param bucket: s3 bucket
+		:param key: s3 key
+		:param part_size: size of the parts (at least 5MB, as required by s3)
+		:param put_kwargs: other arguments of the upload (e.g. ContentType, Metadata)
+		"""
+		super().__init__()
+		if part_size < self.MIN_PART_SIZE:
+			raise ValueError(f'part_size must be at least {self.MIN_PART_SIZE} bytes')
+
+		self.client = s3.meta.client
+		self.bucket = bucket
+		self.key = key
+		self.part_size = part_size
+		self.put_kwargs = put_kwargs
+
+		self._buffer = bytearray()
+		self._upload_id = None
+		self._parts = []
+
+	def writable(self):
+		return True
+
+	def write(self, b):
+		if self.closed:
+			raise ValueError('write to closed file')
+		self._buffer += b
+		while len(self._buffer) >= self.part_size:
+			self._upload_part(bytes(self._buffer[:self.part_size]))
+			del self._buffer[:self.part_size]
+		return len(b)
+
+	def _upload_part(self, data):
+		if self._upload_id is None:
+			self._upload_id = self.client.create_multipart_upload(
+				Bucket=self.bucket, Key=self.key, **self.put_kwargs
+			)['UploadId']
+
+		part_number = len(self._parts) + 1
+		response = self.client.upload_part(
+			Bucket=self.bucket,
+			Key=self.key,
+			UploadId=self._upload_id,
+			PartNumber=part_number,
+			Body=data
+		)
+		self._parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+
+	def close(self):
+		if self.closed:
+			return
+		if self._upload_id is None:
+			self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer), **self.put_kwargs)
+		else:
+			if self._buffer:
+				self._upload_part(bytes(self._buffer))
+			self.client.complete_multipart_upload(
+				Bucket=self.bucket,
+				Key=self.key,
+				UploadId=self._upload_id,
+				MultipartUpload={'Parts': self._parts}
+			)
+		self._buffer = bytearray()
+		super().close()
+
+	def abort(self):
+		if self._upload_id is not None:
+			self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+			self._upload_id = None
+		self._buffer = bytearray()
+		super().close()
+
+	def __exit__(self, exc_type, exc, tb):
+		if exc_type is not None:
+			self.abort()
+		else:
+			self.close()
+
 
 class MetadataUtils:
+	# metadata whose values are converted to int by get_clear_meta_dict
+	INT_METAS = frozenset([
+		"productionvalue",
+		"realismocontenuto",
+		"durataepisodi",
+		"erotismo",
+		"linguaggioverbalevolgare",
+		"presenzaimmaginiforti",
+		"umorismo",
+		"violenza",
+		"ritmodelracconto",
+		'realismorappresentazione',
+		"numeroepisodi"
+	])
+
 	@staticmethod
 	def concat_key_value(key, value, sep='='):
 		if isinstance(value, list):
@@ -255,7 +1192,7 @@ class MetadataUtils:
 				if name in int_list:
 					value = int(value)
 				elif value.upper() in ['FALSE', 'TRUE'] and key != 'keyword':
-					value = eval(value.capitalize())
+					value = value.upper() == 'TRUE'
 
 				res.append(int(value) if name in int_list else value)
 
@@ -297,32 +1234,58 @@ class MetadataUtils:
 		:param sep:
 		:return:
 		"""
+		blacklist = set() if blacklist is None else set(blacklist)
+		array_matcher = PatternMatcher.get([] if array_list is None else array_list)
+		return MetadataUtils._group_clear_meta(lst, blacklist, sep, array_matcher)
+
+	@staticmethod
+	def get_clear_meta_dicts(lsts, blacklist=None, sep='=', array_list=None):
+		"""
+		batch version of get_clear_meta_dict: blacklist and array_list are prepared
+		once for all the lists
+		:param lsts: iterable of lists of metadata{sep}value
+		:param blacklist:
+		:param sep:
+		:param array_list:
+		:return: the list of clear meta dictionaries
+		"""
+		blacklist = set() if blacklist is None else set(blacklist)
+		array_matcher = PatternMatcher.get([] if array_list is None else array_list)
+		return [MetadataUtils._group_clear_meta(lst, blacklist, sep, array_matcher) for lst in lsts]
+
+	@staticmethod
+	def _group_clear_meta(lst, blacklist, sep, array_matcher):
+		# single pass: every entry is split once and appended to the values of its key
+		int_metas = MetadataUtils.INT_METAS
+		grouped = {}
+		for meta in lst:
+			i = meta.index(sep)
+			key = meta[:i]
+			if key in blacklist:
+				continue
+
+			value = meta[i + 1:]
+			if key in int_metas:
+				value = int(value)
+			elif key != 'keyword':
+				upper_value = value.upper()
+				if upper_value == 'TRUE':
+					value = True
+				elif upper_value == 'FALSE':
+					value = False
+
+			values = grouped.get(key)
+			if values is None:
+				grouped[key] = [value]
+			else:
+				values.append(value)
+
 		res_dict = {}
-		metas = MetadataUtils.get_unique_metas(lst, sep=sep)
-		if blacklist is not None:
-			metas = [i for i in metas if i not in blacklist]
-
-		cols_number = [
-			"productionvalue",
-			"realismocontenuto",
-			"durataepisodi",
-			"erotismo",
-			"linguaggioverbalevolgare",
-			"presenzaimmaginiforti",
-			"umorismo",
-			"violenza",
-			"ritmodelracconto",
-			'realismorappresentazione',
-			"numeroepisodi"
-		]
-
-		for l in metas:
-			val = MetadataUtils.get_meta_value(l, lst, cols_number, sep=sep)
-
-			if not isinstance(val, list) and Utils.isin(l, array_list):
-				val = [val]
-
-			res_dict[l] = val
+		for key, values in grouped.items():
+			if len(values) > 1 or array_matcher.match(key):
+				res_dict[key] = values
+			else:
+				res_dict[key] = values[0]
 
 		return res_dict
 
@@ -383,19 +1346,17 @@ class MetadataUtils:
 		:return:
 		"""
 		# ci sono certi metadati che devono essere presi da Mythematics
-		for t in common_metas:
-			if MetadataUtils.check_elem_in_clearmeta(t, mcm_clearmeta, sep) and \
-					MetadataUtils.check_elem_in_clearmeta(t, mythem_clearmeta, sep):
-				mcm_clearmeta = MetadataUtils.del_items_from_clearmeta(t, mcm_clearmeta, sep)
-
-		return sorted(list(set(mcm_clearmeta + mythem_clearmeta)))
+		return ClearMeta.from_list(mcm_clearmeta, sep).merge(
+			ClearMeta.from_list(mythem_clearmeta, sep),
+			common_metas
+		).to_list()
 
 	@staticmethod
 	def hash_algo(r, encoding):
 		return hashlib.md5(r.encode(encoding)).hexdigest()
 
 	@staticmethod
-	def hashing_meta(array, encoding='utf-8', key_value_sep='=', fingerprint_sep=' ', bl=None):
+	def hashing_meta(array, encoding='utf-8', key_value_sep='=', fingerprint_sep=' ', bl=None, version='md5'):
 		"""
 		In questo flusso di Merge il fingerprint viene completamente ricalcolato e non viene fatta una unione
 		tra il fingerprint MCM e quello Mythematics perchè ci sono alcuni metadati in MCM (ad es. people-attore)
@@ -405,12 +1366,212 @@ class MetadataUtils:
 		:param key_value_sep:
 		:param fingerprint_sep:
 		:param bl: blacklist of metadata
+		:param version: fingerprint version (see FingerprintEngine.VERSIONS)
 		:return:
 		"""
+		engine = FingerprintEngine.get(
+			version=version,
+			encoding=encoding,
+			key_value_sep=key_value_sep,
+			fingerprint_sep=fingerprint_sep
+		)
+		return engine.fingerprint(array, bl=bl)
+
+
+class ClearMeta:
+	"""
+	A clear_meta (list of metadata{sep}value) indexed by metadata: each entry is
+	parsed once and duplicated entries are removed. Merge, deletion and filters
+	work on the index and to_list serializes it back to the sorted list.
+		>>> mcm = ClearMeta.from_list(['genere=western', 'attore=terence', 'anno=1974'])
+		>>> mythem = ClearMeta.from_list(['genere=comedy', 'attore=terence', 'regista=leone'])
+		>>> mcm.merge(mythem, ['genere', 'anno']).to_list()
+		>>> ['anno=1974', 'attore=terence', 'genere=comedy', 'regista=leone']
+	"""
+	def __init__(self, sep='='):
+		self.sep = sep
+		# metadata -> values (a dict is used as an insertion-ordered set)
+		self._metas = {}
+
+	@staticmethod
+	def from_list(lst, sep='='):
+		"""
+		:param lst: list of metadata{sep}value
+		:param sep:
+		:return: a ClearMeta
+		"""
+		clear_meta = ClearMeta(sep)
+		metas = clear_meta._metas
+		for meta in lst:
+			i = meta.index(sep)
+			key = meta[:i]
+			values = metas.get(key)
+			if values is None:
+				metas[key] = {meta[i + 1:]: None}
+			else:
+				values[meta[i + 1:]] = None
+		return clear_meta
+
+	def add(self, key, value):
+		self._metas.setdefault(key, {})[value] = None
+
+	def delete(self, key):
+		"""
+		delete all the entries of metadata key (like MetadataUtils.del_items_from_clearmeta)
+		"""
+		self._metas.pop(key, None)
+
+	def get(self, key):
+		"""
+		:return: the list of values of metadata key
+		"""
+		return list(self._metas.get(key, ()))
+
+	def keys(self):
+		return list(self._metas)
+
+	def copy(self):
+		clear_meta = ClearMeta(self.sep)
+		clear_meta._metas = {k: v.copy() for k, v in self._metas.items()}
+		return clear_meta
+
+	def merge(self, other, common_metas=()):
+		"""
+		Union of self (e.g. MCM) and other (e.g. Mythematics): for the metadata in
+		common_metas present in both, only the values of other are kept
+		(see MetadataUtils.merge_lst)
+		:param other: a ClearMeta
+		:param common_metas: metadata where other has precedence
+		:return: a new ClearMeta
+		"""
+		merged = self.copy()
+		for key in common_metas:
+			if key in merged._metas and key in other._metas:
+				del merged._metas[key]
+
+		for key, values in other._metas.items():
+			merged_values = merged._metas.get(key)
+			if merged_values is None:
+				merged._metas[key] = values.copy()
+			else:
+				merged_values.update(values)
+		return merged
+
+	def filter(self, blacklist_metas=None, blacklist_metavalues=None):
+		"""
+		remove the metadata matching blacklist_metas and the values matching
+		blacklist_metavalues (patterns as in Utils.isin)
+		:return: a new ClearMeta
+		"""
+		meta_matcher = PatternMatcher.get([] if blacklist_metas is None else blacklist_metas)
+		value_matcher = PatternMatcher.get([] if blacklist_metavalues is None else blacklist_metavalues)
+
+		filtered = ClearMeta(self.sep)
+		for key in meta_matcher.exclude(self._metas):
+			values = {v: None for v in value_matcher.exclude(self._metas[key])}
+			if values:
+				filtered._metas[key] = values
+		return filtered
+
+	def to_list(self):
+		"""
+		:return: the sorted list of metadata{sep}value
+		"""
+		sep = self.sep
+		return sorted(f'{k}{sep}{v}' for k, values in self._metas.items() for v in values)
+
+	def __contains__(self, key):
+		return key in self._metas
+
+	def __len__(self):
+		return sum(len(values) for values in self._metas.values())
+
+	def __iter__(self):
+		sep = self.sep
+		for k, values in self._metas.items():
+			for v in values:
+				yield f'{k}{sep}{v}'
+
+
+class FingerprintEngine:
+	"""
+	Computes the fingerprint of MetadataUtils.hashing_meta keeping a bounded LRU cache
+	of meta -> digest, since the same metadata (genres, moods, actors, ...) appear
+	in many contents. The 'md5' version is byte-identical to the original
+	hashing_meta; 'blake2b' (16 bytes digest) is a faster opt-in version whose
+	fingerprints are NOT comparable with the md5 ones.
+		>>> engine = FingerprintEngine.get()
+		>>> engine.fingerprint(['genere=western', 'attore=bud'])
+		>>> fingerprints = engine.fingerprint_many(clear_metas_lists)
+	"""
+	VERSIONS = {
+		'md5': lambda b: hashlib.md5(b).hexdigest(),
+		'blake2b': lambda b: hashlib.blake2b(b, digest_size=16).hexdigest(),
+	}
+
+	def __init__(self, version='md5', encoding='utf-8', key_value_sep='=', fingerprint_sep=' ', cache_size=65536):
+		"""
+		:param version: a key of FingerprintEngine.VERSIONS
+		:param encoding:
+		:param key_value_sep:
+		:param fingerprint_sep:
+		:param cache_size: max number of meta digests kept in memory
+		"""
+		if version not in self.VERSIONS:
+			raise ValueError(f"Fingerprint version {version} not valid: {','.join(self.VERSIONS)}")
+
+		self.version = version
+		self.encoding = encoding
+		self.key_value_sep = key_value_sep
+		self.fingerprint_sep = fingerprint_sep
+		self.cache_size = cache_size
+
+		self._hash = self.VERSIONS[version]
+		self._meta_digest = functools.lru_cache(maxsize=cache_size)(self._meta_digest_uncached)
+		Instrumentation.register_cache(f'fingerprint.{version}', self.cache_info)
+
+	@staticmethod
+	@functools.lru_cache(maxsize=None)
+	def _get(version, encoding, key_value_sep, fingerprint_sep):
+		return FingerprintEngine(version, encoding, key_value_sep, fingerprint_sep)
+
+	@staticmethod
+	def get(version='md5', encoding='utf-8', key_value_sep='=', fingerprint_sep=' '):
+		"""
+		return the shared engine with the given configuration
+		"""
+		return FingerprintEngine._get(version, encoding, key_value_sep, fingerprint_sep)
+
+	def _meta_digest_uncached(self, meta):
+		return self._hash(meta.replace(self.key_value_sep, '', 1).encode(self.encoding))
+
+	@Instrumentation.timed('fingerprint')
+	def fingerprint(self, array, bl=None):
+		"""
+		:param array: list of metadata{key_value_sep}value
+		:param bl: blacklist of metadata
+		:return: the fingerprint (sorted digests of the metadata joined by fingerprint_sep)
+		"""
 		bl = [] if bl is None else bl
-		arr = [
-			MetadataUtils.hash_algo(r.replace(key_value_sep, '', 1), encoding)
-			for r in array if r[:r.index(key_value_sep)] not in bl
-		]
-		hashed_lst = sorted(arr)
-		return fingerprint_sep.join(hashed_lst)
+		sep = self.key_value_sep
+		meta_digest = self._meta_digest
+		return self.fingerprint_sep.join(sorted(
+			meta_digest(r) for r in array if r[:r.index(sep)] not in bl
+		))
+
+	@Instrumentation.timed('fingerprint_many')
+	def fingerprint_many(self, arrays, bl=None):
+		"""
+		fingerprint of many lists of metadata, sharing the meta digest cache (hashing
+		short strings is cheaper than sending them to other processes)
+		:param arrays: iterable of lists of metadata
+		:param bl: blacklist of metadata
+		:return: the list of fingerprints, in the order of arrays
+		"""
+		return [self.fingerprint(array, bl=bl) for array in arrays]
+
+	def cache_info(self):
+		return self._meta_digest.cache_info()
+
+	def cache_clear(self):
+		self._meta_digest.cache_clear()
@@ -0,0 +1,53 @@
+"""
+Lazy facade of the easy package: a class is imported (with its dependencies) only
+when it is first accessed, so importing the pure metadata utilities does not load
+boto3, botocore, requests, elasticsearch or slack.
+	>>> from easy import MetadataUtils, ClearMeta
+
+Names shared by a module and its class (e.g. Utils, MCMHelper, EasySlack) are
+the modules, as the import system binds submodules to the package: every class,
+those included, is in the lazy namespace easy.classes
+	>>> from easy.classes import MCMHelper, EasySlack
+
+AsyncS3Utils needs the async extra (aiobotocore), so it is accessible but not
+exported by `from easy import *`.
+"""
+import importlib
+
+from easy.classes import CLASS_MODULES as _ALL_CLASS_MODULES, OPTIONAL_CLASSES as _OPTIONAL
+
+_MODULES = [
+	'AsyncS3Utils',
+	'ClientFactory',
+	'EasyCloudWatch',
+	'EasyElasticSearch',
+	'EasyLambdaTrigger',
+	'EasySlack',
+	'Instrumentation',
+	'MCMHelper',
+	'MappingIndex',
+	'SessionRegistry',
+	'Utils',
+	'classes',
+]
+
+_CLASS_MODULES = {
+	name: module for name, module in _ALL_CLASS_MODULES.items() if name not in _MODULES
+}
+
+__all__ = sorted(name for name in _MODULES + list(_CLASS_MODULES) if name not in _OPTIONAL)
+
+
+def __getattr__(name):
+	if name in _CLASS_MODULES:
+		value = getattr(importlib.import_module(f'{__name__}.{_CLASS_MODULES[name]}'), name)
+	elif name in _MODULES:
+		value = importlib.import_module(f'{__name__}.{name}')
+	else:
+		raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+	globals()[name] = value
+	return value
+
+
+def __dir__():
+	return sorted(_MODULES + list(_CLASS_MODULES))
@@ -0,0 +1,57 @@
+"""
+Lazy namespace of every class of the easy package, including the classes named
+as their module (Utils, MCMHelper, EasySlack, ...), that in the easy package are
+the modules. A class is imported (with its dependencies) only when it is accessed.
+	>>> from easy.classes import MCMHelper, S3Utils, EasySlack
+	>>> import easy.classes as ec
+	>>> ec.EasyLambdaTrigger(...)
+
+AsyncS3Utils needs the async extra (aiobotocore), so it is accessible but not
+exported by `from easy.classes import *`.
+"""
+import importlib
+
+CLASS_MODULES = {
+	'AsyncS3Utils': 'AsyncS3Utils',
+	'ClientFactory': 'ClientFactory',
+	'EasyCloudWatch': 'EasyCloudWatch',
+	'EasyCloudWatchHandler': 'EasyCloudWatch',
+	'EasyElasticSearch': 'EasyElasticSearch',
+	'EasyLambdaTrigger': 'EasyLambdaTrigger',
+	'EventSourceWaiter': 'EasyLambdaTrigger',
+	'EasyLambdaFleet': 'EasyLambdaTrigger',
+	'EasySlack': 'EasySlack',
+	'SlackNotifier': 'EasySlack',
+	'Instrumentation': 'Instrumentation',
+	'MCMHelper': 'MCMHelper',
+	'MergeResult': 'MCMHelper',
+	'MappingIndex': 'MappingIndex',
+	'SessionRegistry': 'SessionRegistry',
+	'SessionStats': 'SessionRegistry',
+	'PatternMatcher': 'Utils',
+	'ValueNormalizer': 'Utils',
+	'TTLCache': 'Utils',
+	'Utils': 'Utils',
+	'S3Utils': 'Utils',
+	'S3MultipartWriter': 'Utils',
+	'MetadataUtils': 'Utils',
+	'ClearMeta': 'Utils',
+	'FingerprintEngine': 'Utils',
+}
+
+# classes whose module needs an optional extra
+OPTIONAL_CLASSES = ['AsyncS3Utils']
+
+__all__ = sorted(name for name in CLASS_MODULES if name not in OPTIONAL_CLASSES)
+
+
+def __getattr__(name):
+	if name not in CLASS_MODULES:
+		raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+	value = getattr(importlib.import_module(f'easy.{CLASS_MODULES[name]}'), name)
+	globals()[name] = value
+	return value
+
+
+def __dir__():
+	return sorted(CLASS_MODULES)
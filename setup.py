@@ -18,9 +18,15 @@ setuptools.setup(
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     install_requires=[
         'slackclient>=2.1.0', 'boto3', 'botocore',
         'requests', 'urllib3', 'validators', 'requests_aws4auth', 'elasticsearch==7.13.2'
-    ]
+    ],
+    extras_require={
+        'async': ['aiobotocore'],
+        'bench': ['pytest>=7', 'pytest-benchmark', 'moto[s3]'],
+        'test': ['pytest>=7', 'moto[s3,logs,server]', 'aiobotocore'],
+        'zstd': ['zstandard'],
+    }
 )
\ No newline at end of file
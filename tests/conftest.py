@@ -0,0 +1,26 @@
+import os
+
+import boto3
+import pytest
+
+try:
+	from moto import mock_aws
+except ImportError:
+	from moto import mock_s3 as mock_aws
+
+BUCKET = 'test-bucket'
+
+
+@pytest.fixture
+def aws_credentials():
+	os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+	os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+	os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-1')
+
+
+@pytest.fixture
+def s3(aws_credentials):
+	with mock_aws():
+		s3 = boto3.resource('s3', region_name='eu-west-1')
+		s3.meta.client.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={'LocationConstraint': 'eu-west-1'})
+		yield s3
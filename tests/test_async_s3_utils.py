@@ -0,0 +1,47 @@
+import asyncio
+
+import boto3
+import pytest
+
+pytest.importorskip('aiobotocore')
+moto_server = pytest.importorskip('moto.server')
+
+from easy.AsyncS3Utils import AsyncS3Utils  # noqa: E402
+
+from conftest import BUCKET  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def endpoint_url():
+	server = moto_server.ThreadedMotoServer(port=0, verbose=False)
+	server.start()
+	host, port = server.get_host_and_port()
+	yield f'http://{host}:{port}'
+	server.stop()
+
+
+def test_concurrent_first_calls_share_one_client(aws_credentials, endpoint_url, monkeypatch):
+	client = boto3.client('s3', region_name='us-east-1', endpoint_url=endpoint_url)
+	client.create_bucket(Bucket=BUCKET)
+	client.put_object(Bucket=BUCKET, Key='doc.json', Body=b'{"a": 1}')
+
+	s3_utils = AsyncS3Utils(region_name='us-east-1', endpoint_url=endpoint_url, max_concurrency=3)
+	created = []
+	create_client = s3_utils._session.create_client
+
+	def counting_create_client(*args, **kwargs):
+		created.append(1)
+		return create_client(*args, **kwargs)
+
+	monkeypatch.setattr(s3_utils._session, 'create_client', counting_create_client)
+
+	async def main():
+		contents = await asyncio.gather(*[s3_utils.read_s3_file(BUCKET, 'doc.json') for _ in range(20)])
+		semaphore = s3_utils._semaphore
+		await s3_utils.read_s3_file(BUCKET, 'doc.json')
+		assert s3_utils._semaphore is semaphore
+		await s3_utils.close()
+		return contents
+
+	assert asyncio.run(main()) == ['{"a": 1}'] * 20
+	assert len(created) == 1
@@ -0,0 +1,27 @@
+import boto3
+
+from easy.EasyCloudWatch import EasyCloudWatch
+
+from conftest import mock_aws
+
+
+def count_calls(client, operation):
+	calls = []
+	client.meta.events.register(f'before-call.logs.{operation}', lambda **kwargs: calls.append(1))
+	return calls
+
+
+def test_provisioning_is_memoized_per_client(aws_credentials):
+	with mock_aws():
+		first = boto3.client('logs', region_name='eu-west-1')
+		second = boto3.client('logs', region_name='eu-west-1')
+		first_calls = count_calls(first, 'CreateLogStream')
+		second_calls = count_calls(second, 'CreateLogStream')
+
+		EasyCloudWatch('group', 'stream', logs_client=first)
+		EasyCloudWatch('group', 'stream', logs_client=first)
+		# e.g. another profile or account in the same region
+		EasyCloudWatch('group', 'stream', logs_client=second)
+
+		assert len(first_calls) == 1
+		assert len(second_calls) == 1
@@ -0,0 +1,39 @@
+import json
+
+from elasticsearch.serializer import JSONSerializer
+
+from easy.EasyElasticSearch import EasyElasticSearch
+
+
+class FakeTransport:
+	serializer = JSONSerializer()
+
+
+class FakeElasticsearch:
+	transport = FakeTransport()
+
+	def __init__(self, reject_ids=()):
+		self.reject_ids = set(reject_ids)
+		self.requests = 0
+
+	def bulk(self, body):
+		self.requests += 1
+		lines = body.strip().split('\n')
+		items = []
+		for action in lines[::2]:
+			identifier = json.loads(action)['index']['_id']
+			status = 400 if identifier in self.reject_ids else 201
+			items.append({'index': {'_id': identifier, 'status': status}})
+		return {'items': items}
+
+
+def test_bulk_index_reports_every_document():
+	es_client = FakeElasticsearch(reject_ids=['7'])
+	es = EasyElasticSearch('localhost', 443, es_client=es_client)
+	documents = ({'id': str(i), 'title': f'title {i}'} for i in range(95))
+
+	results = list(es.bulk_index('contents', documents, id_field='id', chunk_size=10, thread_count=3))
+
+	assert len(results) == 95
+	assert es_client.requests == 10
+	assert [item['index']['_id'] for ok, item in results if not ok] == ['7']
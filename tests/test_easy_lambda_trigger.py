@@ -0,0 +1,44 @@
+from easy.EasyLambdaTrigger import EasyLambdaFleet
+
+ARN = 'arn:aws:lambda:eu-west-1:123456789012:function'
+
+
+class FakePaginator:
+	def __init__(self, client):
+		self.client = client
+
+	def paginate(self):
+		yield {'EventSourceMappings': list(self.client.mappings.values())}
+
+
+class FakeLambdaClient:
+	def __init__(self, mappings):
+		self.mappings = {mapping['UUID']: mapping for mapping in mappings}
+		self.updates = []
+
+	def get_paginator(self, name):
+		return FakePaginator(self)
+
+	def update_event_source_mapping(self, **kwargs):
+		self.updates.append(kwargs)
+		mapping = self.mappings[kwargs['UUID']]
+		mapping['State'] = 'Enabled' if kwargs['Enabled'] else 'Disabled'
+		if 'FunctionName' in kwargs:
+			mapping['FunctionArn'] = f"{ARN}:{kwargs['FunctionName']}"
+
+
+def test_update_triggers_keeps_the_function_qualifier():
+	client = FakeLambdaClient([
+		{'UUID': 'u1', 'FunctionArn': f'{ARN}:app-reader:live', 'State': 'Enabled'},
+		{'UUID': 'u2', 'FunctionArn': f'{ARN}:app-writer:3', 'State': 'Enabled'},
+		{'UUID': 'u3', 'FunctionArn': f'{ARN}:other', 'State': 'Enabled'},
+	])
+	fleet = EasyLambdaFleet(prefix='app-', lambda_client=client)
+
+	summary = fleet.update_triggers(enable=False)
+
+	assert {uuid: result['result'] for uuid, result in summary.items()} == {'u1': 'updated', 'u2': 'updated'}
+	assert all('FunctionName' not in update for update in client.updates)
+	assert client.mappings['u1']['FunctionArn'] == f'{ARN}:app-reader:live'
+	assert client.mappings['u2']['FunctionArn'] == f'{ARN}:app-writer:3'
+	assert client.mappings['u3']['State'] == 'Enabled'
@@ -0,0 +1,67 @@
+import threading
+import time
+
+from slack.errors import SlackApiError
+
+from easy.EasySlack import EasySlack, SlackNotifier
+
+
+class FakeResponse(dict):
+	def __init__(self, error, headers=None):
+		super().__init__(error=error)
+		self.headers = headers or {}
+
+
+class FakeClient:
+	def __init__(self):
+		self.messages = []
+
+	def chat_postMessage(self, channel, text):
+		self.messages.append((channel, text))
+
+
+def test_track_message_is_synchronous_by_default():
+	client = FakeClient()
+	slack = EasySlack('app', None, client=client)
+
+	slack.track_message(lambda text: None, '#alerts', 'hello')
+
+	assert slack.notifier is None
+	assert client.messages == [('#alerts', '*app*: hello')]
+
+
+def test_background_thread_stops_when_idle():
+	client = FakeClient()
+	threads = threading.active_count()
+	slack = EasySlack('app', None, background=True, client=client, idle_timeout=0.1)
+
+	slack.track_message(lambda text: None, '#alerts', 'hello')
+	assert slack.notifier.flush(5)
+	time.sleep(0.5)
+
+	assert client.messages == [('#alerts', '*app*: hello')]
+	assert slack.notifier._thread is None
+	assert threading.active_count() == threads
+
+
+def test_rate_limited_messages_are_requeued_within_queue_size():
+	sent = []
+	limited = threading.Event()
+
+	def send(channel, text):
+		if not limited.is_set():
+			limited.set()
+			# fill the queue while the first batch is being sent
+			for i in range(3):
+				notifier.submit(channel, f'new{i}')
+			raise SlackApiError('ratelimited', FakeResponse('ratelimited', {'Retry-After': '0'}))
+		sent.append(text)
+
+	notifier = SlackNotifier(send, queue_size=3, burst=10, rate=100, max_digest_messages=1)
+	notifier.submit('#alerts', 'old')
+	assert notifier.flush(5)
+	notifier.close()
+
+	assert notifier._size == 0
+	assert notifier.dropped == 1
+	assert sent == ['new0', 'new1', 'new2']
@@ -0,0 +1,36 @@
+import pytest
+
+from easy.Instrumentation import Instrumentation
+from easy.Utils import S3Utils
+
+from conftest import BUCKET
+
+
+@pytest.fixture(autouse=True)
+def instrumentation():
+	enabled = Instrumentation.enabled
+	Instrumentation.enable()
+	Instrumentation.reset()
+	yield
+	Instrumentation.reset()
+	Instrumentation.enabled = enabled
+
+
+def test_not_found_is_not_an_error(s3):
+	S3Utils.write_json_if_toupdate(s3, {'a': 1}, BUCKET, 'new.json')
+	with pytest.raises(FileNotFoundError):
+		S3Utils.read_s3_file(s3, BUCKET, 'missing.json')
+
+	snapshot = Instrumentation.snapshot()
+	assert snapshot['counters']['s3.head_not_found'] == 1
+	assert snapshot['counters']['s3.get_not_found'] == 1
+	assert not [name for name in snapshot['counters'] if name.endswith('.errors')]
+	assert snapshot['timers']['s3.head']['count'] == 1
+
+
+def test_errors_are_counted():
+	with pytest.raises(ValueError):
+		with Instrumentation.timer('merge'):
+			raise ValueError()
+
+	assert Instrumentation.snapshot()['counters'] == {'merge.errors': 1}
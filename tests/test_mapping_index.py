@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from easy.MappingIndex import MappingIndex
+
+from conftest import BUCKET
+
+
+@pytest.fixture(autouse=True)
+def clear_registry():
+	MappingIndex.clear_registry()
+	yield
+	MappingIndex.clear_registry()
+
+
+def put_mapping(s3, mapping, key='mapping.json', field='fcode'):
+	s3.Object(BUCKET, key).put(Body=json.dumps({field: mapping}))
+
+
+def test_get_index_is_shared_across_ttl(s3):
+	put_mapping(s3, {'FD1': 'F1'})
+	first = MappingIndex.get_index(s3, BUCKET, 'mapping.json', 'fcode', ttl=300)
+	second = MappingIndex.get_index(s3, BUCKET, 'mapping.json', 'fcode', ttl=10)
+
+	assert first is second
+	assert second.ttl == 10
+	assert MappingIndex.get_index(s3, BUCKET, 'mapping.json', 'fcode', ttl=None).ttl == 10
+
+
+def test_get_index_uses_the_latest_s3(s3):
+	put_mapping(s3, {'FD1': 'F1'})
+	MappingIndex.get_index(object(), BUCKET, 'mapping.json', 'fcode')
+	index = MappingIndex.get_index(s3, BUCKET, 'mapping.json', 'fcode')
+
+	assert index.get('FD1') == 'F1'
+
+
+def test_reverse_get_of_list_values(s3):
+	put_mapping(s3, {'F1': ['FD1', 'FD2'], 'F2': 'FD1', 'F3': {'nested': 1}}, field='video_content_ids')
+	index = MappingIndex.get_index(s3, BUCKET, 'mapping.json', 'video_content_ids')
+
+	assert index.reverse_get('FD1') == ['F1', 'F2']
+	assert index.reverse_get('FD2') == ['F1']
+	assert index.get('F1') == ['FD1', 'FD2']
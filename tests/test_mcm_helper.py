@@ -0,0 +1,51 @@
+import json
+
+from easy.MCMHelper import MCMHelper
+
+from conftest import BUCKET
+
+DATA_CONF = {
+	's3_bucket': BUCKET,
+	's3_mcm_season': 'mcm/season',
+	's3_mcm_series': 'mcm/series',
+	's3_mythematics_fingerprint': 'mythem/fingerprint',
+	's3_mythematics_season_fingerprint': 'mythem/season',
+}
+CONTENT_CONF = {'blacklist_metas': [], 'blacklist_metavalues': []}
+
+
+def put_json(s3, key, js):
+	s3.Object(BUCKET, key).put(Body=json.dumps(js))
+
+
+def test_merge_many_reads_series_contents(s3):
+	for i in range(30):
+		put_json(s3, f'mcm/series/S{i}.json', {'clear_metas': ['genre=drama']})
+	put_json(s3, 'mythem/fingerprint/S0.json', {'clear_metas': ['mood=dark'], 'idserie': 'S0'})
+	helper = MCMHelper(s3, DATA_CONF, CONTENT_CONF)
+
+	results = {res.fcode: res for res in helper.merge_many([f'S{i}' for i in range(30)], [], mcm_reader='series', max_workers=4)}
+
+	assert all(res.error is None and res.document is not None for res in results.values())
+	assert results['S0'].document['idserie'] == 'S0'
+	assert results['S1'].document['mythematics_source'] == 'mcm'
+
+
+def test_merge_many_with_a_callable_reader(s3):
+	helper = MCMHelper(s3, DATA_CONF, CONTENT_CONF)
+
+	results = list(helper.merge_many(['F1', 'F2'], [], mcm_reader=lambda fcode: {'clear_metas': [f'id={fcode}']}))
+
+	assert sorted(res.document['clear_metas'][0] for res in results) == ['id=F1', 'id=F2']
+
+
+def test_merge_many_reports_errors(s3):
+	helper = MCMHelper(s3, DATA_CONF, CONTENT_CONF)
+
+	def reader(fcode):
+		raise RuntimeError(fcode)
+
+	results = list(helper.merge_many(['F1'], [], mcm_reader=reader))
+
+	assert isinstance(results[0].error, RuntimeError)
+	assert list(helper.merge_many(['F1'], [])) == [(('F1', None, None))]
@@ -0,0 +1,100 @@
+import json
+
+from botocore.exceptions import ClientError
+
+from easy.Instrumentation import Instrumentation
+from easy.Utils import S3Utils
+
+from conftest import BUCKET
+
+
+def read_json(s3, key):
+	return json.loads(S3Utils.read_s3_file(s3, BUCKET, key))
+
+
+def test_write_json_if_toupdate_skips_an_equal_json(s3):
+	assert S3Utils.write_json_if_toupdate(s3, {'a': 1, 'ts': 5}, BUCKET, 'doc.json', drop=['ts'])
+	assert not S3Utils.write_json_if_toupdate(s3, {'a': 1, 'ts': 6}, BUCKET, 'doc.json', drop=['ts'])
+	assert read_json(s3, 'doc.json') == {'a': 1, 'ts': 5}
+
+
+def test_write_json_if_toupdate_with_another_drop(s3):
+	S3Utils.write_json_if_toupdate(s3, {'a': 1, 'ts': 5}, BUCKET, 'doc.json', drop=['ts'])
+
+	assert S3Utils.write_json_if_toupdate(s3, {'a': 1}, BUCKET, 'doc.json')
+	assert read_json(s3, 'doc.json') == {'a': 1}
+	assert not S3Utils.write_json_if_toupdate(s3, {'a': 1}, BUCKET, 'doc.json')
+
+
+def test_json_already_exists_without_digest_metadata(s3):
+	s3.Object(BUCKET, 'doc.json').put(Body=json.dumps({'b': 2, 'a': 1}))
+
+	assert S3Utils.json_already_exists(s3, {'a': 1, 'b': 2}, BUCKET, 'doc.json')
+	assert not S3Utils.json_already_exists(s3, {'a': 1}, BUCKET, 'doc.json')
+
+
+def test_write_json_if_toupdate_when_head_is_forbidden(s3, monkeypatch):
+	# without s3:ListBucket the HEAD of a missing key is a 403
+	def head_object(**kwargs):
+		raise ClientError({'Error': {'Code': '403', 'Message': 'Forbidden'}}, 'HeadObject')
+
+	monkeypatch.setattr(s3.meta.client, 'head_object', head_object)
+
+	assert S3Utils.write_json_if_toupdate(s3, {'a': 1}, BUCKET, 'new.json')
+	assert read_json(s3, 'new.json') == {'a': 1}
+
+
+def test_sync_json_documents_is_scoped_to_the_prefix(s3):
+	s3.Object(BUCKET, 'merged_old/keep.json').put(Body=b'{}')
+	s3.Object(BUCKET, 'merged/stale.json').put(Body=b'{}')
+	documents = {'F1.json': {'a': 1}, 'F2.json': {'b': 2}}
+
+	report = S3Utils.sync_json_documents(s3, BUCKET, 'merged', documents, delete=True)
+
+	assert sorted(report['created']) == ['F1.json', 'F2.json']
+	assert report['deleted'] == ['stale.json']
+	assert report['failed'] == {}
+	assert read_json(s3, 'merged_old/keep.json') == {}
+	assert read_json(s3, 'merged/F1.json') == {'a': 1}
+
+
+def test_sync_json_documents_reports_unchanged_and_updated(s3):
+	S3Utils.sync_json_documents(s3, BUCKET, 'merged/', {'F1.json': {'a': 1}, 'F2.json': {'b': 2}})
+
+	report = S3Utils.sync_json_documents(s3, BUCKET, 'merged/', {'F1.json': {'a': 1}, 'F2.json': {'b': 3}})
+
+	assert report['unchanged'] == ['F1.json']
+	assert report['updated'] == ['F2.json']
+	assert not S3Utils.write_json_if_toupdate(s3, {'b': 3}, BUCKET, 'merged/F2.json')
+
+
+def test_sync_json_documents_dry_run(s3):
+	s3.Object(BUCKET, 'merged/stale.json').put(Body=b'{}')
+
+	report = S3Utils.sync_json_documents(s3, BUCKET, 'merged/', {'F1.json': {'a': 1}}, delete=True, dry_run=True)
+
+	assert report['created'] == ['F1.json']
+	assert report['deleted'] == ['stale.json']
+	assert [obj.key for obj in s3.Bucket(BUCKET).objects.all()] == ['merged/stale.json']
+
+
+def test_write_s3_file_measures_str_in_bytes(s3, monkeypatch):
+	counts = []
+	monkeypatch.setattr(Instrumentation, 'enabled', True)
+	monkeypatch.setattr(Instrumentation, 'count', lambda name, value=1: counts.append((name, value)))
+	text = 'è' * 3000
+
+	S3Utils.write_s3_file(s3, BUCKET, 'text.txt', text, multipart_threshold=5000, part_size=5 * 1024 * 1024)
+
+	assert ('s3.put_bytes', 6000) in counts
+	assert ('s3.multipart_uploads', 1) in counts
+	assert S3Utils.read_s3_file(s3, BUCKET, 'text.txt') == text
+
+
+def test_write_s3_file_compressed(s3):
+	text = 'è' * 3000
+
+	S3Utils.write_s3_file(s3, BUCKET, 'text.txt.gz', text, compression='gzip')
+
+	assert s3.Object(BUCKET, 'text.txt.gz').get()['ContentEncoding'] == 'gzip'
+	assert S3Utils.read_s3_file(s3, BUCKET, 'text.txt.gz') == text
@@ -0,0 +1,50 @@
+import http.server
+import threading
+
+import pytest
+
+from easy.SessionRegistry import SessionRegistry
+from easy.Utils import Utils
+
+
+class OkHandler(http.server.BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+
+	def do_GET(self):
+		self.send_response(200)
+		self.send_header('Content-Length', '2')
+		self.end_headers()
+		self.wfile.write(b'ok')
+
+	def log_message(self, *args):
+		pass
+
+
+@pytest.fixture
+def url():
+	server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), OkHandler)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	SessionRegistry.clear()
+	yield f'http://127.0.0.1:{server.server_port}/'
+	SessionRegistry.clear()
+	server.shutdown()
+
+
+def test_sessions_do_not_share_headers():
+	first = Utils.requests_retry_session()
+	first.headers['Authorization'] = 'Bearer A'
+	second = Utils.requests_retry_session()
+
+	assert first is not second
+	assert 'Authorization' not in second.headers
+
+
+def test_sessions_share_the_connections(url):
+	for _ in range(5):
+		with Utils.requests_retry_session() as session:
+			assert session.get(url).text == 'ok'
+
+	stats = SessionRegistry.stats()
+	assert stats['requests'] == 5
+	assert stats['connections'] == 1
+	assert stats['reused_connections'] == 4
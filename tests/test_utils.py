@@ -0,0 +1,54 @@
+import threading
+import time
+
+import pytest
+
+from easy.Utils import FingerprintEngine, MetadataUtils, Utils
+
+
+def test_map_unordered_yields_every_item():
+	results = {item: future.result() for item, future in Utils.map_unordered(lambda x: x * 2, range(100), 4)}
+
+	assert results == {i: i * 2 for i in range(100)}
+
+
+def test_map_unordered_bounds_the_items_in_flight():
+	lock = threading.Lock()
+	pulled = []
+
+	def items():
+		for i in range(50):
+			with lock:
+				pulled.append(i)
+			yield i
+
+	in_flight = []
+	for done, (item, future) in enumerate(Utils.map_unordered(lambda x: time.sleep(0.001), items(), max_workers=2), 1):
+		with lock:
+			in_flight.append(len(pulled) - done)
+	assert len(pulled) == 50
+	assert max(in_flight) <= 2 * 2
+
+
+def test_map_unordered_reports_errors_in_the_future():
+	def func(x):
+		if x == 3:
+			raise ValueError(x)
+		return x
+
+	errors = []
+	for item, future in Utils.map_unordered(func, range(5), 2):
+		if future.exception() is not None:
+			errors.append(item)
+	assert errors == [3]
+	with pytest.raises(ValueError):
+		for _, future in Utils.map_unordered(func, [3], 1):
+			future.result()
+
+
+def test_fingerprint_many_matches_hashing_meta():
+	arrays = [[f'genere=g{i % 7}', f'attore=a{i % 11}', 'anno=2019'] for i in range(50)]
+
+	assert FingerprintEngine.get().fingerprint_many(arrays, bl=['anno']) == [
+		MetadataUtils.hashing_meta(array, bl=['anno']) for array in arrays
+	]